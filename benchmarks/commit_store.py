@@ -0,0 +1,151 @@
+# Compares the memory taken by commits held as LogEntry tuples with the same
+# commits in a CommitTable, and times decoding them back. The table should
+# stay around 250 bytes per commit on top of the message text, against
+# about 700 for a LogEntry.
+#
+# It also compares laying out a log as LogGraphLoader used to, with rows
+# holding the LogEntry tuples read, against the loader's first log of a repo,
+# which goes through LogCache.rows and lays out the store's CommitViews.
+# Usage: python commit_store.py [commits]
+import datetime
+import itertools
+import os
+import os.path
+import sys
+import time
+import resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'src'))
+
+import dateutil.tz
+
+import git_api
+from berk.gui.history import LogCache, LogGraphLayout
+from berk.gui.history.commit_store import CommitStore, CommitTable
+
+
+AUTHOR_COUNT = 500
+MESSAGE = ('Fix the frobnicator when the widget count is %d', '',
+    'The frobnicator divided by the widget count, which is zero for new',
+    'workspaces. Skip it in that case.')
+
+
+def synthetic_log(commit_count):
+    timezone = dateutil.tz.tzoffset(None, 3600)
+    start = datetime.datetime(2010, 1, 1, tzinfo=timezone)
+    for i in xrange(commit_count):
+        author = i % AUTHOR_COUNT
+        date = start + datetime.timedelta(minutes=i)
+        parent_ids = ('%040x' % (i + 1),) if i + 1 < commit_count else ()
+        yield git_api.LogEntry('%040x' % i, parent_ids,
+            'Author %d' % author, 'author%d@example.com' % author, date,
+            'Author %d' % author, 'author%d@example.com' % author, date,
+            (MESSAGE[0] % i,) + MESSAGE[1:])
+
+
+def table_size(table):
+    size = sum(sys.getsizeof(column) for column in (table.ids,
+        table.authors, table.committers, table.author_times,
+        table.author_offsets, table.committer_times, table.committer_offsets,
+        table.parent_ends, table.parents, table.message_starts,
+        table.message_ends, table.messages, table.complete,
+        table.identity_positions, table.identities))
+    size += sys.getsizeof(table.positions)
+    size += sum(sys.getsizeof(packed_id) for packed_id in table.positions)
+    size += sum(sys.getsizeof(identity) + sum(sys.getsizeof(field)
+        for field in identity) for identity in table.identities)
+    return size
+
+
+# what LogCache and the layout look at, without a repository
+class SyntheticRepo(object):
+    git_dir = 'synthetic'
+    ref_map = None
+    head_ref = None
+
+    def __init__(self, commit_count):
+        self.commit_count = commit_count
+
+    def log(self, **kwargs):
+        return synthetic_log(self.commit_count)
+
+
+# a disk cache that has nothing cached yet
+class EmptyCache(object):
+    def load(self, namespace, key, fingerprint=None):
+        return None
+
+
+def log_entry_rows(commit_count):
+    layout = LogGraphLayout(SyntheticRepo(commit_count))
+    layout.feed(synthetic_log(commit_count))
+    return layout.rows
+
+
+def commit_store_rows(commit_count):
+    repo = SyntheticRepo(commit_count)
+    log_cache = LogCache(repo, EmptyCache())
+    return list(log_cache.rows(LogGraphLayout(repo), ('tip',),
+        CommitStore(repo)))
+
+
+def measure(func, *args):
+    # the time func takes, and the memory it leaves allocated, measured in a
+    # child process so that every run starts out the same
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if not pid:
+        start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        result = func(*args)
+        elapsed = time.time() - start
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+        os.write(write_end, '%f %d' % (elapsed, rss * 1024))
+        os._exit(0)
+    os.close(write_end)
+    output = os.read(read_end, 100)
+    os.close(read_end)
+    os.waitpid(pid, 0)
+    elapsed, size = output.split()
+    return float(elapsed), int(size)
+
+
+def main(commit_count=1000000):
+    print '%d commits' % commit_count
+    for name, func in (('LogEntry rows', log_entry_rows),
+            ('CommitView rows', commit_store_rows)):
+        elapsed, size = measure(func, commit_count)
+        print '%-15s %d MB (%d bytes/commit), laid out in %.2fs' % (name,
+            size >> 20, size // commit_count, elapsed)
+
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    log = list(synthetic_log(commit_count))
+    log_size = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss -
+        start_rss) * 1024
+    message_size = sum(len(line) + 1 for line in log[0].message)
+
+    start = time.time()
+    table = CommitTable()
+    for log_entry in log:
+        table.add(log_entry)
+    add_time = time.time() - start
+    size = table_size(table)
+
+    start = time.time()
+    for log_entry in itertools.islice(log, 0, None, 10):
+        table.entry(log_entry.commit_id).to_log_entry()
+    decode_time = (time.time() - start) * 10
+
+    print '%d bytes of message each' % message_size
+    print 'LogEntry    %d MB (%d bytes/commit)' % (log_size >> 20,
+        log_size // commit_count)
+    print 'CommitTable %d MB (%d bytes/commit, %d besides the message)' % (
+        size >> 20, size // commit_count,
+        size // commit_count - message_size)
+    print 'add         %.2fs' % add_time
+    print 'decode      %.2fs (all fields of every commit)' % decode_time
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
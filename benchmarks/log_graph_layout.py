@@ -0,0 +1,50 @@
+# Times LogGraphLayout on a synthetic history, with lane_count branches
+# running side by side and regularly merging into their neighbors. Usage:
+# python log_graph_layout.py [commits] [lanes]
+import os
+import os.path
+import sys
+import time
+import resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'src'))
+
+import git_api
+from berk.gui.history import LogGraphLayout
+
+
+MERGE_INTERVAL = 50
+
+
+def synthetic_log(commit_count, lane_count):
+    # commits come newest first, and each one's parent is the next commit in
+    # its own branch, so the history keeps lane_count lanes open throughout
+    for i in xrange(commit_count):
+        parent_ids = []
+        if i + lane_count < commit_count:
+            parent_ids.append('%040x' % (i + lane_count))
+            if i % MERGE_INTERVAL == 0 and i + lane_count + 1 < commit_count:
+                parent_ids.append('%040x' % (i + lane_count + 1))
+        yield git_api.LogEntry('%040x' % i, tuple(parent_ids), None, None,
+            None, None, None, None, ())
+
+
+def main(commit_count=500000, lane_count=100):
+    log = list(synthetic_log(commit_count, lane_count))
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    layout = LogGraphLayout(None)
+    layout.feed(log)
+    elapsed = time.time() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+    runs = set(id(run) for row in layout.rows for run in row.lane_runs)
+    print '%d commits, %d lanes' % (commit_count, lane_count)
+    print 'layout      %.2fs (%.1f commits/ms)' % (elapsed,
+        commit_count / elapsed / 1000)
+    print 'memory      %d MB' % (rss // 1024)
+    print 'lane runs   %d distinct' % len(runs)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,68 @@
+# Times painting a viewport of the log graph into an image, cell by cell as
+# the delegate does, and in one pass as LogGraphView does. Needs a display,
+# such as xvfb-run. Usage: python log_graph_paint.py [rows] [lanes] [frames]
+import os
+import os.path
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'src'))
+
+from PySide.QtCore import QRect
+from PySide.QtGui import QApplication, QImage, QPainter, \
+    QStyleOptionViewItemV4
+
+from berk.gui.history import LogGraphDelegate, LogGraphLayout
+from log_graph_layout import synthetic_log
+
+
+LANE_SIZE = 30
+COMMIT_COUNT = 20000
+
+
+# what the delegate looks at, without reading refs from a repository
+class SyntheticRepo(object):
+    ref_map = None
+    head_ref = None
+
+
+def paint_cells(delegate, image, rows):
+    painter = QPainter(image)
+    option = QStyleOptionViewItemV4()
+    for y, row in enumerate(rows):
+        option.rect = QRect(0, y * LANE_SIZE, image.width(), LANE_SIZE)
+        delegate.paint_row(painter, option, row)
+    painter.end()
+
+
+def paint_viewport(delegate, image, rows):
+    painter = QPainter(image)
+    painter.scale(LANE_SIZE, LANE_SIZE)
+    painter.setRenderHint(QPainter.Antialiasing, True)
+    delegate.paint_graph(painter, rows, QApplication.palette().window())
+    painter.end()
+
+
+def main(row_count=40, lane_count=20, frame_count=200):
+    app = QApplication(sys.argv)
+    layout = LogGraphLayout(SyntheticRepo())
+    layout.feed(synthetic_log(COMMIT_COUNT, lane_count))
+    image = QImage((lane_count + 2) * LANE_SIZE, row_count * LANE_SIZE,
+        QImage.Format_ARGB32_Premultiplied)
+    delegate = LogGraphDelegate()
+    print '%d rows, %d lanes, %d frames' % (row_count, lane_count,
+        frame_count)
+    for name, paint in (('cells', paint_cells),
+            ('viewport', paint_viewport)):
+        start = time.time()
+        for frame in xrange(frame_count):
+            first = frame * row_count % (COMMIT_COUNT - row_count)
+            paint(delegate, image, layout.rows[first:first + row_count])
+        elapsed = time.time() - start
+        print '%-10s  %.2fs (%.2f ms/frame)' % (name, elapsed,
+            elapsed * 1000 / frame_count)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
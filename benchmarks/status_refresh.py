@@ -0,0 +1,82 @@
+# Times Repo.refresh() on a large synthetic work tree, with and without the
+# status accelerations. Usage: python status_refresh.py [dirs] [files per dir]
+import os
+import os.path
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'src'))
+
+import git_api
+from berk.model import Workspace, Repo
+
+
+CONFIGS = [
+    ('plain', {}),
+    ('untracked cache', dict(untracked_cache=True)),
+    ('preload index, 4 threads', dict(preload_index=True, index_threads=4)),
+    ('fsmonitor', dict(fsmonitor=True)),
+    ('all', dict(untracked_cache=True, preload_index=True, index_threads=4,
+        fsmonitor=True)),
+]
+
+RUNS = 5
+
+
+def create_work_tree(root, dir_count, files_per_dir):
+    git = git_api.Git()
+    git.init(root)
+    for i in xrange(dir_count):
+        dir_path = os.path.join(root, 'd%04d' % i, 'sub')
+        os.makedirs(dir_path)
+        for j in xrange(files_per_dir):
+            with open(os.path.join(dir_path, 'f%04d' % j), 'w') as f:
+                f.write('%d %d\n' % (i, j))
+    git.exe.add('--all', _cwd=root).check()
+    git.exe.commit(message='synthetic', quiet=True,
+        _config={'user.name': 'bench', 'user.email': 'bench@example.com'},
+        _cwd=root).check()
+    # a few local changes, so that status has something to report
+    for i in xrange(0, dir_count, 10):
+        dir_path = os.path.join(root, 'd%04d' % i, 'sub')
+        with open(os.path.join(dir_path, 'f0000'), 'a') as f:
+            f.write('changed\n')
+        with open(os.path.join(dir_path, 'untracked'), 'w') as f:
+            f.write('new\n')
+
+
+def time_refresh(repo):
+    repo.refresh()  # warm up caches and daemons
+    timings = []
+    for _ in xrange(RUNS):
+        start = time.time()
+        repo.refresh()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main(dir_count=1000, files_per_dir=50):
+    git = git_api.Git()
+    version, features = git.build_options()
+    print 'git %s, fsmonitor daemon %s' % ('.'.join(map(str, version or ())),
+        'available' if 'fsmonitor--daemon' in features else 'not available')
+    root = tempfile.mkdtemp(prefix='berk-bench-')
+    try:
+        create_work_tree(root, dir_count, files_per_dir)
+        print '%d files' % (dir_count * files_per_dir)
+        workspace = Workspace(git)
+        for name, options in CONFIGS:
+            repo = Repo(work_tree_dir=root, **options)
+            workspace.add_repo(repo)
+            print '%-28s %.3fs' % (name, time_refresh(repo))
+    finally:
+        if 'fsmonitor--daemon' in features:
+            git.exe.fsmonitor__daemon('stop', _cwd=root, _ok_codes=(0, 1)).check()
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -13,6 +13,7 @@ from berk import dev_resources
 
 from berk import Event
 
+from berk.cache import DiskCache
 from berk.model import Workspace
 
 from berk.gui import View
@@ -55,7 +56,7 @@ class Application(QApplication):
 
 def main(argv):
     git = git_api.Git()
-    workspace = Workspace(git)
+    workspace = Workspace(git, cache=DiskCache())
     app = Application.create(workspace, argv=argv)
     main_window = WorkspaceWindow()
     main_window.open_default_views()
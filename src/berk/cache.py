@@ -0,0 +1,84 @@
+import os
+import os.path
+import errno
+import hashlib
+import tempfile
+import cPickle as pickle
+
+
+CACHE_FORMAT_VERSION = 2
+
+
+def default_cache_dir():
+    return os.path.join(os.path.expanduser('~'), '.berk', 'cache')
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# Entries are grouped by namespace and keyed by a string, such as a repo's git
+# dir. An entry is only returned by load() if the caller presents the same
+# fingerprint it was stored with, so stale entries are never used.
+#
+# The cache is only an optimization: failing to read or write it, such as in
+# a read-only or full cache dir, is the same as having no entry.
+class DiskCache(object):
+    def __init__(self, base_dir=None):
+        self.base_dir = base_dir or default_cache_dir()
+
+    def entry_path(self, namespace, key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return os.path.join(self.base_dir, namespace,
+            hashlib.sha1(key).hexdigest())
+
+    def load(self, namespace, key, fingerprint=None):
+        try:
+            with open(self.entry_path(namespace, key), 'rb') as f:
+                version, stored_key, stored_fingerprint = pickle.load(f)
+                if (version, stored_key) != (CACHE_FORMAT_VERSION, key):
+                    return None
+                if stored_fingerprint != fingerprint:
+                    return None
+                return pickle.load(f)
+        except Exception:
+            # a corrupt or outdated entry can fail to unpickle in many ways,
+            # such as naming a class that's gone
+            return None
+
+    def store(self, namespace, key, value, fingerprint=None):
+        path = self.entry_path(namespace, key)
+        entry_dir = os.path.dirname(path)
+        try:
+            try:
+                os.makedirs(entry_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST: raise
+            # write to a temporary file first, so that a crash never leaves a
+            # truncated entry behind
+            temp_fd, temp_path = tempfile.mkstemp(dir=entry_dir)
+        except (OSError, IOError):
+            return
+        try:
+            with os.fdopen(temp_fd, 'wb') as f:
+                pickle.dump((CACHE_FORMAT_VERSION, key, fingerprint), f,
+                    pickle.HIGHEST_PROTOCOL)
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            if os.name == 'nt' and os.path.exists(path):
+                os.remove(path)
+            os.rename(temp_path, path)
+        except (OSError, IOError, pickle.PicklingError):
+            _remove_quietly(temp_path)
+        except:
+            _remove_quietly(temp_path)
+            raise
+
+    def discard(self, namespace, key):
+        try:
+            os.remove(self.entry_path(namespace, key))
+        except OSError as e:
+            if e.errno != errno.ENOENT: raise
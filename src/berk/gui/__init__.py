@@ -1,15 +1,20 @@
 import operator
 import functools
 import contextlib
+import array
+import bisect
+import itertools
 import sys
+import traceback
 
 from berk import Event
 
 from PySide.QtUiTools import QUiLoader
-from PySide.QtGui import QApplication, QBrush, QColor, QCursor, QDialog, \
-    QDockWidget, QLineEdit, QMainWindow, QPainter, QPalette, \
-    QSortFilterProxyModel, QStyle, QStyleOption, QWidget
-from PySide.QtCore import QEvent, QObject, QRect, Qt, Signal
+from PySide.QtGui import QAbstractProxyModel, QApplication, QBrush, QColor, \
+    QCursor, QDialog, QDockWidget, QLineEdit, QMainWindow, QPainter, \
+    QPalette, QStyle, QStyleOption, QWidget
+from PySide.QtCore import QEvent, QModelIndex, QObject, QRect, QThread, Qt, \
+    Signal
 
 
 if sys.platform == 'win32':
@@ -56,6 +61,42 @@ def busy_cursor(widget=None, cursor=Qt.WaitCursor):
 
 
 
+class BackgroundTask(QThread):
+    running_tasks = set()
+
+    def __init__(self, func, callback=None):
+        super(BackgroundTask, self).__init__()
+        self.func = func
+        self.callback = callback
+        self.result = None
+        self.error = None
+        # the thread object lives on the UI thread, so this connection is
+        # queued and the callback runs on the UI thread
+        self.finished.connect(self.task_finished)
+
+    def run(self):
+        try:
+            self.result = self.func()
+        except:
+            self.error = sys.exc_info()
+
+    def task_finished(self):
+        BackgroundTask.running_tasks.discard(self)
+        if self.error:
+            traceback.print_exception(*self.error)
+        elif self.callback:
+            self.callback(self.result)
+
+def run_in_background(func, callback=None):
+    task = BackgroundTask(func, callback)
+    # keep a reference until the task is done, or it will get collected
+    BackgroundTask.running_tasks.add(task)
+    task.start()
+    return task
+
+
+
+
 def loadable_widget(arg):
     def make_decorator(widget_name):
         def decorator(cls):
@@ -196,6 +237,19 @@ class FilterEditor(QLineEdit):
 
 
 
+def contiguous_ranges(rows):
+    # yields (first, last) pairs for each run of consecutive rows
+    rows = sorted(rows)
+    if not rows: return
+    first = last = rows[0]
+    for row in rows[1:]:
+        if row != last + 1:
+            yield first, last
+            first = row
+        last = row
+    yield first, last
+
+
 def model_item(qt_index):
     if not (qt_index and qt_index.isValid()): return None
     return qt_index.model().model_item(qt_index)
@@ -219,32 +273,209 @@ class FilterSet(object):
     def __call__(self, item):
         return all(func(item) for func in self._filters)
 
-
-class FilterModel(QSortFilterProxyModel):
+    def __nonzero__(self):
+        return bool(self._filters)
+
+    # Returns a flag for each item, set if it passes every filter. A filter
+    # may have a select(items) method of its own, which flags all the items
+    # in one call, and such filters go first, so that the others are only
+    # called for the items still passing.
+    def select(self, items):
+        if not hasattr(items, '__len__'):
+            items = list(items)
+        flags = bytearray('\x01') * len(items)
+        for func in sorted(self._filters,
+                key=lambda func: not hasattr(func, 'select')):
+            if hasattr(func, 'select'):
+                flags = bytearray(itertools.imap(operator.and_, flags,
+                    func.select(items)))
+            else:
+                flags = bytearray(bool(flag and func(item))
+                    for flag, item in itertools.izip(flags, items))
+        return flags
+
+
+def model_row_items(model, first, last):
+    if hasattr(model, 'model_items'):
+        return model.model_items(first, last)
+    return [model_item(model.index(row, 0)) for row in xrange(first, last + 1)]
+
+
+# A proxy showing the rows of a flat source model whose items pass filters.
+# Which source rows are accepted is kept as a flag per row, computed in one
+# pass over the items (see FilterSet.select), and the accepted rows as a
+# sorted array, which maps proxy rows to source rows directly and source rows
+# back by bisection. Rows inserted or changed in the source are filtered
+# alone; changing the filters filters every row again as a layout change,
+# so the selection and current index of the view carry over.
+#
+# row_items_getter(model, first, last) returns the items that the filters
+# get for source rows first to last. By default, they are the items of the
+# source model, read with its model_items(first, last) when it has one.
+class FilterModel(QAbstractProxyModel):
     def __init__(self, parent=None):
         super(FilterModel, self).__init__(parent=parent)
         self.filters = FilterSet()
-        self.filters.changed += self.invalidateFilter
-        self._row_item_getter = lambda model, row, parent: model_item(
-            model.index(row, 0, parent))
+        self.filters.changed += self.invalidate_filter
+        self._row_items_getter = model_row_items
+        self._flags = bytearray()
+        self._rows = array.array('l')
 
     @property
-    def row_item_getter(self):
-        return self._row_item_getter
-
-    @row_item_getter.setter
-    def row_item_getter(self, func):
-        self._row_item_getter = func
-        self.invalidateFilter()
+    def row_items_getter(self):
+        return self._row_items_getter
+
+    @row_items_getter.setter
+    def row_items_getter(self, func):
+        self._row_items_getter = func
+        self.invalidate_filter()
+
+    # anything but rows inserted or changed is handled as a reset
+    def _source_connections(self, model):
+        return [
+            (model.rowsInserted, self._source_rows_inserted),
+            (model.dataChanged, self._source_data_changed),
+            (model.headerDataChanged, self.headerDataChanged),
+        ] + [(signal, self._source_about_to_reset) for signal in (
+            model.rowsAboutToBeRemoved, model.modelAboutToBeReset,
+            model.layoutAboutToBeChanged, model.columnsAboutToBeInserted,
+            model.columnsAboutToBeRemoved)
+        ] + [(signal, self._source_reset) for signal in (
+            model.rowsRemoved, model.modelReset, model.layoutChanged,
+            model.columnsInserted, model.columnsRemoved)]
+
+    def setSourceModel(self, model):
+        old_model = self.sourceModel()
+        if old_model:
+            for signal, handler in self._source_connections(old_model):
+                signal.disconnect(handler)
+        self.beginResetModel()
+        super(FilterModel, self).setSourceModel(model)
+        self._filter_all()
+        self.endResetModel()
+        if model:
+            for signal, handler in self._source_connections(model):
+                signal.connect(handler)
+
+    def _source_about_to_reset(self, *args):
+        self.beginResetModel()
+
+    def _source_reset(self, *args):
+        self._filter_all()
+        self.endResetModel()
+
+    def _source_row_count(self):
+        model = self.sourceModel()
+        return model.rowCount(QModelIndex()) if model else 0
+
+    def _select(self, first, last):
+        if last < first: return bytearray()
+        if not self.filters:
+            return bytearray('\x01') * (last - first + 1)
+        return self.filters.select(self.row_items_getter(self.sourceModel(),
+            first, last))
+
+    def _filter_all(self):
+        self._flags = self._select(0, self._source_row_count() - 1)
+        self._rows = array.array('l', itertools.compress(
+            xrange(len(self._flags)), self._flags))
+
+    def invalidate_filter(self):
+        self.layoutAboutToBeChanged.emit()
+        old_rows = self._rows
+        self._filter_all()
+        for index in self.persistentIndexList():
+            source_row = old_rows[index.row()]
+            self.changePersistentIndex(index, self.createIndex(
+                self._proxy_row(source_row), index.column(), None)
+                if self._flags[source_row] else QModelIndex())
+        self.layoutChanged.emit()
+
+    def _proxy_row(self, source_row):
+        # the proxy row of an accepted source row, or of the first accepted
+        # one after it
+        return bisect.bisect_left(self._rows, source_row)
+
+    def _source_rows_inserted(self, parent, first, last):
+        count = last - first + 1
+        flags = self._select(first, last)
+        new_rows = [row for row, flag in enumerate(flags, first) if flag]
+        position = self._proxy_row(first)
+        # rows past the insertion move down, whether accepted or not
+        if position < len(self._rows):
+            self._rows[position:] = array.array('l',
+                (row + count for row in self._rows[position:]))
+        self._flags[first:first] = flags
+        if new_rows:
+            self.beginInsertRows(QModelIndex(), position,
+                position + len(new_rows) - 1)
+            self._rows[position:position] = array.array('l', new_rows)
+            self.endInsertRows()
+
+    def _source_data_changed(self, top_left, bottom_right):
+        first, last = top_left.row(), bottom_right.row()
+        flags = self._select(first, last)
+        # rows changing sides are removed or inserted a run at a time
+        changed = [row for row, flag in enumerate(flags, first)
+            if flag != self._flags[row]]
+        for run_first, run_last in contiguous_ranges(row for row in changed
+                if not flags[row - first]):
+            position = self._proxy_row(run_first)
+            count = run_last - run_first + 1
+            self.beginRemoveRows(QModelIndex(), position, position + count - 1)
+            del self._rows[position:position + count]
+            self._flags[run_first:run_last + 1] = '\x00' * count
+            self.endRemoveRows()
+        for run_first, run_last in contiguous_ranges(row for row in changed
+                if flags[row - first]):
+            position = self._proxy_row(run_first)
+            count = run_last - run_first + 1
+            self.beginInsertRows(QModelIndex(), position, position + count - 1)
+            self._rows[position:position] = array.array('l',
+                xrange(run_first, run_last + 1))
+            self._flags[run_first:run_last + 1] = '\x01' * count
+            self.endInsertRows()
+        first_position = self._proxy_row(first)
+        last_position = self._proxy_row(last + 1) - 1
+        if first_position <= last_position:
+            self.dataChanged.emit(
+                self.createIndex(first_position, top_left.column(), None),
+                self.createIndex(last_position, bottom_right.column(), None))
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not 0 <= row < len(self._rows) or \
+                not 0 <= column < self.columnCount(parent):
+            return QModelIndex()
+        return self.createIndex(row, column, None)
+
+    def parent(self, index):
+        return QModelIndex()
+
+    def rowCount(self, parent):
+        if parent.isValid(): return 0
+        return len(self._rows)
+
+    def columnCount(self, parent):
+        model = self.sourceModel()
+        if parent.isValid() or not model: return 0
+        return model.columnCount(QModelIndex())
+
+    def mapToSource(self, index):
+        if not index.isValid(): return QModelIndex()
+        return self.sourceModel().index(self._rows[index.row()],
+            index.column())
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid(): return QModelIndex()
+        source_row = source_index.row()
+        if not self._flags[source_row]: return QModelIndex()
+        return self.createIndex(self._proxy_row(source_row),
+            source_index.column(), None)
 
     def model_item(self, index):
         if not index.isValid(): return None
         return self.sourceModel().model_item(self.mapToSource(index))
 
-    def filterAcceptsRow(self, source_row, source_parent):
-        return self.filters(self.row_item_getter(self.sourceModel(), source_row,
-            source_parent))
-
 
 
 
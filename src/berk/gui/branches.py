@@ -55,6 +55,9 @@ class BranchModel(QAbstractTableModel):
         if not index.isValid(): return None
         return self.repo.branches[index.row()]
 
+    def model_items(self, first, last):
+        return self.repo.branches[first:last + 1]
+
     @property
     def checkable(self):
         return self._checkable
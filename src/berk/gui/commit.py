@@ -9,13 +9,18 @@ from berk.gui import busy_cursor, connect_destructor, Dialog, FileIconProvider,
 from berk.gui.workspace import apply_status_to_icon, deep_file_list, \
     exclude_ignored, exclude_unmodified
 from berk.gui.workspace.file_view import FileModel
+from berk.gui.history.commit_store import CommitStore
 from berk.gui.history.select_commit import SelectCommitDialog
 
 
 class CommitDialog(Dialog):
     def __init__(self, repo, selected_items, parent=None):
         super(CommitDialog, self).__init__(parent=parent)
+        connect_destructor(self)
         self.repo = repo
+        # held for as long as the dialog lives, so that picking an old message
+        # again doesn't read the log again
+        self.commit_store = CommitStore.acquire(repo)
         self.dialog_buttons.button(QDialogButtonBox.Ok).setEnabled(False)
         self.selected_items = selected_items
         if len(selected_items) == 1 and isinstance(selected_items[0],
@@ -42,10 +47,7 @@ class CommitDialog(Dialog):
             else:
                 self.local_changes_button.setChecked(True)
                 self.show_local_changes()
-            if self.repo.head_ref:
-                (self.last_commit,) = self.repo.log(max_commits=1)
-            else:
-                self.last_commit = None
+            if not self.repo.head_ref:
                 self.action_reuse_last_msg.setEnabled(False)
                 self.action_reuse_log_msg.setEnabled(False)
                 self.amend_checkbox.setEnabled(False)
@@ -63,6 +65,9 @@ class CommitDialog(Dialog):
         self.action_reuse_log_msg.triggered.connect(self.select_old_message)
         self.amend_checkbox.toggled.connect(self.amend_toggled)
 
+    def _destroyed(self):
+        self.commit_store.release()
+
     @property
     def use_staged_changes(self):
         return self.staged_changes_button.isChecked()
@@ -105,13 +110,16 @@ class CommitDialog(Dialog):
         self.update_ok_button()
 
     def reuse_last_message(self):
-        self.message_text.setPlainText('\n'.join(self.last_commit.message))
+        (last_commit,) = self.commit_store.get([self.repo.head_id])
+        self.message_text.setPlainText('\n'.join(last_commit.message))
 
     def select_old_message(self):
         dialog = SelectCommitDialog(self.repo, parent=self)
         if dialog.exec_() == dialog.Accepted:
             self.message_text.setPlainText('\n'.join(
                 dialog.selected_commit.message))
+        # its log model holds on to the repo's commit store until deleted
+        dialog.deleteLater()
 
     def amend_toggled(self, should_amend):
         if should_amend and not self.message:
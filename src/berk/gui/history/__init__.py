@@ -1,40 +1,73 @@
 import collections
 import bisect
-import posixpath
+import itertools
+import sys
+import time
+import traceback
 
 import git_api
 
-from berk.gui import busy_cursor, connect_destructor, FilterModel, \
-    loadable_widget, model_item, rgb_color, setup_ui
+from berk.gui import connect_destructor, FilterModel, \
+    loadable_widget, model_item, rgb_color, run_in_background, setup_ui
 from berk.gui.branches import PickBranchesDialog
+from berk.gui.history.commit_store import CommitStore
+from berk.gui.history.search import CommitSearchIndex, narrows, \
+    parse_git_query, parse_query, SearchChunk
 
-from PySide.QtCore import QAbstractTableModel, QPointF, QSize, Qt
+from PySide.QtCore import QAbstractTableModel, QModelIndex, QPoint, QPointF, \
+    QRect, QRectF, QSize, QThread, Qt, Signal
 from PySide.QtGui import QAction, QActionGroup, QApplication, QBrush, \
-    QFontMetrics, QFrame, QMenu, QPainter, QPainterPath, QPen, QStyle, \
-    QStyledItemDelegate, QStyleOptionFocusRect
-
-
-def commit_matches_text(commit, text):
-    return any(
-        (text in str(attr)
-        if not isinstance(attr, tuple)
-        else any(text in str(item) for item in attr))
-            for attr in commit)
+    QFontMetrics, QFrame, QHeaderView, QMenu, QPainter, QPainterPath, QPen, \
+    QPixmap, QStyle, QStyledItemDelegate, QStyleOptionFocusRect, \
+    QStyleOptionViewItemV4, QTableView
 
 
 # Needs to be a class instead of namedtuple, because PySide converts tuples
 # into Qt types and isinstance(data, GraphRow) will fail
 class GraphRow(object):
-    def __init__(self, repo, log_entry, prev_row, commit_node, edges):
+    __slots__ = ('repo', 'log_entry', 'prev_row', 'commit_node',
+        'parent_edges', 'lane_runs', 'max_edge_lane', 'max_lane')
+
+    def __init__(self, repo, log_entry, prev_row, commit_node, parent_edges,
+            lane_runs):
         self.repo = repo
         self.log_entry = log_entry
         self.prev_row = prev_row
         self.commit_node = commit_node
-        self.edges = edges
+        self.parent_edges = parent_edges
+        self.lane_runs = lane_runs
+        self.max_edge_lane = max(itertools.chain(
+            (max(edge.from_lane, edge.to_lane) for edge in parent_edges),
+            (max(run.last_lane, run.last_lane - run.shift)
+                for run in lane_runs),
+            (0,)))
+        # the rightmost lane drawn in the row, including the bottom half of
+        # the previous row's edges
+        self.max_lane = max(commit_node.lane, self.max_edge_lane,
+            prev_row.max_edge_lane if prev_row else 0)
+
+    @property
+    def refs(self):
+        # looked up on every use, so that they're current (see Repo.ref_map)
+        ref_map = self.repo.ref_map
+        return ref_map.get(self.log_entry.commit_id, ()) if ref_map else ()
+
+    @property
+    def edges(self):
+        edges = list(self.parent_edges)
+        for run in self.lane_runs:
+            edges.extend(GraphEdge(lane - run.shift, lane, run.colors[lane])
+                for lane in xrange(run.first_lane, run.last_lane + 1))
+        return edges
 
 GraphNode = collections.namedtuple('GraphNode', ('lane', 'color'))
 GraphEdge = collections.namedtuple('GraphEdge',
     ('from_lane', 'to_lane', 'color'))
+# The lanes from first_lane to last_lane that pass by a commit, each coming
+# from shift lanes to its left. colors is indexed by lane, and is shared by all
+# the runs laid out while the lane colors stay the same.
+LaneRun = collections.namedtuple('LaneRun',
+    ('first_lane', 'last_lane', 'shift', 'colors'))
 LaneData = collections.namedtuple('LaneData', ('commit_id', 'color'))
 
 
@@ -48,7 +81,22 @@ class LogGraphModel(QAbstractTableModel):
         lambda row: row.log_entry.commit_id
     ]
 
-    def __init__(self, repo, revs=None, paths=None, all=False, parent=None):
+    # emitted with the number of rows loaded so far
+    loading_progress = Signal(int)
+    loading_finished = Signal()
+
+    # log_filters are passed on to git log (see git_api.Git.log), and
+    # filter_paths add to paths. The commits they leave out would break up the
+    # graph, so it's simplified to a plain list while they're in effect.
+    #
+    # With subject_only, the messages of the commits loaded are only their
+    # subject line. full_entry() reads the rest when it's needed. The search
+    # index still gets whole messages.
+    #
+    # Once the repo is refreshed, its refs are read again in the background,
+    # and the log is only reloaded if the commits it starts from have moved.
+    def __init__(self, repo, revs=None, paths=None, all=False,
+            subject_only=False, parent=None):
         super(LogGraphModel, self).__init__(parent=parent)
         connect_destructor(self)
         self.column_names = [self.tr('Graph'), self.tr('Message'),
@@ -57,35 +105,108 @@ class LogGraphModel(QAbstractTableModel):
         self.revs = revs
         self.paths = paths
         self.all = all
-        self.graph = None
-        self.repo.workspace.before_repo_refreshed += self.before_repo_refreshed
+        self.subject_only = subject_only
+        self.log_filters = {}
+        self.filter_paths = ()
+        self.graph = []
+        self.search_index = None
+        self.loader = None
+        self.log_state = None
+        self.refs_task = None
+        self.commit_store = CommitStore.acquire(repo)
         self.repo.workspace.repo_refreshed += self.repo_refreshed
+        self.repo.workspace.refs_refreshed += self.refs_refreshed
         self.refresh()
 
     def _destroyed(self):
-        self.repo.workspace.before_repo_refreshed -= self.before_repo_refreshed
         self.repo.workspace.repo_refreshed -= self.repo_refreshed
+        self.repo.workspace.refs_refreshed -= self.refs_refreshed
+        self.refs_task = None
+        self._stop_loading()
+        self.commit_store.release()
+
+    @property
+    def loading(self):
+        return self.loader is not None
 
     def model_item(self, index):
         return self.graph[index.row()]
 
+    def full_entry(self, row):
+        return self.commit_store.get([row.log_entry.commit_id])[0]
+
     def refresh(self):
         self.beginResetModel()
         self._refresh_graph()
         self.endResetModel()
 
+    # The log is read and laid out on a LogGraphLoader thread, and its rows
+    # are appended here in batches, so the view stays usable while loading
     def _refresh_graph(self):
-        self.graph = create_log_graph(self.repo, self.repo.log(revs=self.revs,
-            paths=self.paths, all=self.all))
-
-    def before_repo_refreshed(self, repo):
-        if repo is self.repo:
-            self.beginResetModel()
+        self._stop_loading()
+        self.refs_task = None
+        self.log_state = None
+        self.graph = []
+        self.search_index = CommitSearchIndex()
+        self.loader = LogGraphLoader(self.repo, self.commit_store,
+            revs=self.revs,
+            paths=list(self.paths or ()) + list(self.filter_paths),
+            all=self.all, subject_only=self.subject_only,
+            log_filters=self.log_filters)
+        self.loader.refs_loaded.connect(self._refs_loaded)
+        self.loader.rows_loaded.connect(self._rows_loaded)
+        self.loader.done.connect(self._loader_done)
+        self.loader.start()
+        self.loading_progress.emit(0)
+
+    def _stop_loading(self):
+        if self.loader:
+            self.loader.cancel()
+            self.loader = None
+
+    def _log_state(self, tips):
+        # None when it can't be told whether the log is still the same
+        return None if tips is None else (tips, self.repo.scopes)
+
+    def _refs_loaded(self, loader, ref_map, tips):
+        if loader is not self.loader: return
+        self.log_state = self._log_state(tips)
+        self.repo.apply_ref_map(ref_map)
+
+    def _rows_loaded(self, loader, rows, search_chunk):
+        if loader is not self.loader: return
+        self.search_index.add(search_chunk)
+        first = len(self.graph)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.graph.extend(rows)
+        self.endInsertRows()
+        self.loading_progress.emit(len(self.graph))
+
+    def _loader_done(self, loader):
+        if loader is not self.loader: return
+        self.loader = None
+        self.loading_finished.emit()
 
     def repo_refreshed(self, repo):
-        if repo is self.repo:
-            self._refresh_graph()
-            self.endResetModel()
+        if repo is not self.repo: return
+        revs, all = self.revs, self.all
+        def read_refs():
+            ref_map = repo.read_ref_map()
+            return ref_map, log_tips(repo, revs, all, ref_map)
+        def refs_read(result):
+            if task is not self.refs_task: return
+            self.refs_task = None
+            ref_map, tips = result
+            repo.apply_ref_map(ref_map)
+            log_state = self._log_state(tips)
+            if log_state is None or log_state != self.log_state:
+                self.refresh()
+        task = self.refs_task = run_in_background(read_refs, refs_read)
+
+    def refs_refreshed(self, repo):
+        if repo is self.repo and self.graph:
+            self.dataChanged.emit(self.index(0, 0),
+                self.index(len(self.graph) - 1, 0))
 
     def rowCount(self, parent):
         return len(self.graph)
@@ -117,62 +238,386 @@ class LogGraphModel(QAbstractTableModel):
         return self.column_names[section]
 
 
+class LogGraphLoader(QThread):
+    running_loaders = set()
+    # rows are delivered at least this often (in seconds), and at most
+    # max_batch_size at a time
+    batch_interval = 0.1
+    max_batch_size = 5000
+
+    # all are emitted with the loader itself, since a cancelled loader's
+    # signals may still be queued when its replacement starts
+    refs_loaded = Signal(object, object, object)
+    rows_loaded = Signal(object, object, object)
+    done = Signal(object)
+
+    def __init__(self, repo, commit_store, revs=None, paths=None, all=False,
+            subject_only=False, log_filters=None):
+        super(LogGraphLoader, self).__init__()
+        self.repo = repo
+        self.commit_store = commit_store
+        self.revs = revs
+        self.paths = paths
+        self.all = all
+        self.subject_only = subject_only
+        self.log_filters = log_filters or {}
+        self.log_cache = LogCache.for_log(repo, revs=revs, paths=paths,
+            all=all, subject_only=subject_only, log_filters=self.log_filters)
+        self.ref_map = None
+        self.cancelled = False
+        self.error = None
+        self.finished.connect(self._finished)
+        # keep a reference until the thread is done, or it will get collected
+        LogGraphLoader.running_loaders.add(self)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        completed = False
+        try:
+            self.ref_map = self.repo.read_ref_map()
+            tips = log_tips(self.repo, self.revs, self.all, self.ref_map)
+            self.refs_loaded.emit(self, self.ref_map, tips)
+            # path-limited logs read much less with an up to date commit-graph
+            if self.paths or self.repo.scopes:
+                try:
+                    self.commit_store.update_commit_graph()
+                except git_api.GitCommandError:
+                    # the log can still be read without it
+                    traceback.print_exc()
+            layout = LogGraphLayout(self.repo)
+            # the disk cache only helps while the store is still empty
+            if self.log_cache and not self.commit_store:
+                rows = self.log_cache.rows(layout, tips, self.commit_store)
+            else:
+                rows = (layout.add_commit(log_entry)
+                    for log_entry in self._log_entries())
+            batch = []
+            batch_time = time.time()
+            for row in rows:
+                if self.cancelled: return
+                batch.append(row)
+                if len(batch) >= self.max_batch_size or \
+                        time.time() - batch_time >= self.batch_interval:
+                    self._emit_rows(batch)
+                    batch = []
+                    batch_time = time.time()
+            if batch and not self.cancelled:
+                self._emit_rows(batch)
+            completed = not self.cancelled
+        except:
+            self.error = sys.exc_info()
+        finally:
+            self.done.emit(self)
+        # the rows are all shown by now, so storing them delays nothing
+        if completed and self.log_cache:
+            try:
+                self.log_cache.save()
+            except:
+                self.error = sys.exc_info()
+
+    # rows only ever hold commits from the store (see CommitStore.add_commit)
+    def _log_entries(self):
+        if not self.log_filters:
+            return self.commit_store.log(revs=self.revs, paths=self.paths,
+                all=self.all, subject_only=self.subject_only)
+        return (self.commit_store.add_commit(log_entry,
+                not self.subject_only)._replace(parent_ids=())
+            for log_entry in self.repo.log(revs=self.revs, paths=self.paths,
+                all=self.all, subject_only=self.subject_only,
+                **self.log_filters))
+
+    def _emit_rows(self, rows):
+        # the search text is prepared here too, off the UI thread, and covers
+        # whole messages even if only subjects were loaded
+        log_entries = [row.log_entry for row in rows]
+        if self.subject_only:
+            messages = self.commit_store.messages([log_entry.commit_id
+                for log_entry in log_entries])
+            log_entries = [log_entry._replace(message=message)
+                for log_entry, message in itertools.izip(log_entries,
+                    messages)]
+        search_chunk = SearchChunk(log_entries, self.ref_map)
+        self.rows_loaded.emit(self, rows, search_chunk)
+
+    def _finished(self):
+        LogGraphLoader.running_loaders.discard(self)
+        if self.error:
+            traceback.print_exception(*self.error)
+
+
+def positive_revs(revs=None, all=False):
+    if all: return ['--all']
+    return list(revs or ()) or ['HEAD']
+
+
+def log_tips(repo, revs=None, all=False, ref_map=None):
+    # the commits a log starts from, or None if its revs exclude commits too
+    if all:
+        if ref_map is None:
+            ref_map = repo.read_ref_map()
+        return tuple(sorted(ref_map))
+    try:
+        tips = repo.git.rev_ids(repo.work_tree_dir, repo.git_dir,
+            revs=positive_revs(revs))
+    except git_api.GitCommandError:
+        return None
+    if any(tip.startswith('^') for tip in tips):
+        return None
+    return tips
+
+
+# Keeps the commits of a log and their graph layout on disk, along with the
+# commits the log started from (log_tips). Once refs have moved, only the
+# commits that are new since (git log <revs> --not <old log_tips>) are read
+# and laid out, on top of the cached ones. Laying out the cached commits again
+# stops as soon as the layout reaches the same state as it was in at one of
+# the checkpoints, since every row from there on is the same as before.
+#
+# The new commits always come before the cached ones, which keeps parents
+# after their children, but may order unrelated branches differently from a
+# fresh git log. Logs limited by paths or filters aren't cached.
+#
+# Every commit read, from git or from the cache, is added to the CommitStore
+# given to rows(), and the rows are laid out with the store's CommitViews, so
+# the commits of the log are only held once.
+class LogCache(object):
+    namespace = 'log'
+    checkpoint_interval = 1000
+
+    def __init__(self, repo, cache, revs=None, all=False,
+            subject_only=False):
+        self.repo = repo
+        self.cache = cache
+        self.revs = tuple(revs or ())
+        self.all = all
+        self.subject_only = subject_only
+        self.key = '%s\0%r' % (repo.git_dir, (self.revs, all, subject_only))
+        self.pending = None
+
+    @classmethod
+    def for_log(cls, repo, revs=None, paths=None, all=False,
+            subject_only=False, log_filters=None):
+        cache = repo.workspace.cache
+        if not cache or paths or log_filters or repo.scopes:
+            return None
+        return cls(repo, cache, revs=revs, all=all, subject_only=subject_only)
+
+    def _git(self, method, **kwargs):
+        return method(self.repo.work_tree_dir, self.repo.git_dir, **kwargs)
+
+    def _log(self, **kwargs):
+        return self.repo.log(subject_only=self.subject_only, **kwargs)
+
+    def _positive_revs(self):
+        return positive_revs(self.revs, self.all)
+
+    def _contains(self, log_tips):
+        # whether every commit cached is still part of the log
+        try:
+            return not self._git(self.repo.git.count_commits,
+                revs=list(log_tips) + ['--not'] + self._positive_revs())
+        except git_api.GitCommandError:
+            return False
+
+    # log_tips is None for logs of ranges, since the commits they exclude
+    # can't be carried over
+    def rows(self, layout, log_tips, commit_store):
+        complete = not self.subject_only
+        if log_tips is None:
+            for log_entry in self._log(revs=self.revs, all=self.all):
+                yield layout.add_commit(commit_store.add_commit(log_entry,
+                    complete))
+            return
+
+        cached = self.cache.load(self.namespace, self.key)
+        if cached is not None:
+            (old_log_tips, log_entries, row_data, checkpoints,
+                final_snapshot) = cached
+            if old_log_tips == log_tips:
+                new_entries = ()
+            elif self._contains(old_log_tips):
+                new_entries = self._log(revs=self._positive_revs() +
+                    ['--not'] + list(old_log_tips))
+            else:
+                cached = None
+        if cached is None:
+            log_entries = row_data = final_snapshot = ()
+            checkpoints = {}
+            new_entries = self._log(revs=self.revs, all=self.all)
+        elif old_log_tips == log_tips:
+            # unchanged, so there will be nothing to store
+            log_tips = None
+
+        new_checkpoints = {}
+        def add_commit(log_entry):
+            row_count = len(layout.rows)
+            if row_count % self.checkpoint_interval == 0:
+                new_checkpoints[row_count] = layout.snapshot()[1:]
+            return layout.add_commit(log_entry)
+
+        def stored(position):
+            # the cached entry is dropped as soon as the store has it
+            commit = log_entries[position] = commit_store.add_commit(
+                log_entries[position], complete)
+            return commit
+
+        for log_entry in new_entries:
+            yield add_commit(commit_store.add_commit(log_entry, complete))
+        shift = len(layout.rows)
+        reused = len(log_entries)
+        for position in xrange(len(log_entries)):
+            if position in checkpoints and \
+                    layout.snapshot()[1:] == checkpoints[position]:
+                reused = position
+                break
+            yield add_commit(stored(position))
+        for position in xrange(reused, len(log_entries)):
+            yield layout.add_row(stored(position), row_data[position])
+        if reused < len(log_entries):
+            layout.restore((len(layout.rows),) + final_snapshot[1:])
+            new_checkpoints.update((position + shift, checkpoint)
+                for position, checkpoint in checkpoints.iteritems()
+                if position >= reused)
+
+        if log_tips is not None:
+            self.pending = (log_tips, [row.log_entry for row in layout.rows],
+                [(row.commit_node, row.parent_edges, row.lane_runs)
+                    for row in layout.rows],
+                new_checkpoints, layout.snapshot())
+
+    def save(self):
+        if self.pending is not None:
+            self.cache.store(self.namespace, self.key, self.pending)
+            self.pending = None
+
+
 def create_log_graph(repo, git_log):
-    graph = []
-    lanes = []
-    commit_lane_map = {}
-    color_pool = ColorPool()
-    prev_row = None
-    for log_entry in git_log:
+    layout = LogGraphLayout(repo)
+    layout.feed(git_log)
+    return layout.rows
+
+
+# Lays out the graph one commit at a time, so it can be fed a log in chunks.
+# snapshot() captures the state needed to continue from the current row, and
+# restore() rewinds the layout to such a snapshot.
+#
+# commit_lane_map maps the commit expected in each lane to its LaneData, and
+# the lane's position is looked up with lanes.index(), so that shifting lanes
+# costs a single list insertion instead of renumbering the map. lanes.index()
+# compares by value rather than identity, which finds the same lane, since a
+# commit is expected in one lane at most. Snapshots rely on LaneData comparing
+# by value too.
+class LogGraphLayout(object):
+    def __init__(self, repo):
+        self.repo = repo
+        self.rows = []
+        self.lanes = []
+        self.commit_lane_map = {}
+        self.color_pool = ColorPool()
+        self._reset_lane_colors()
+
+    def _reset_lane_colors(self):
+        self.lane_colors = tuple(lane.color for lane in self.lanes)
+        self._lane_runs = {}
+
+    def _lane_run(self, first_lane, last_lane, shift):
+        key = (first_lane, last_lane, shift)
+        run = self._lane_runs.get(key)
+        if run is None:
+            run = LaneRun(first_lane, last_lane, shift, self.lane_colors)
+            self._lane_runs[key] = run
+        return run
+
+    def feed(self, log_entries):
+        first = len(self.rows)
+        for log_entry in log_entries:
+            self.add_commit(log_entry)
+        return self.rows[first:]
+
+    def add_commit(self, log_entry):
+        lanes = self.lanes
+        commit_lane_map = self.commit_lane_map
+        color_pool = self.color_pool
         # locate the lane for the current commit
-        if log_entry.commit_id in commit_lane_map:
-            commit_lane = commit_lane_map.pop(log_entry.commit_id)
-            commit_color = lanes.pop(commit_lane).color
+        commit_lane_data = commit_lane_map.pop(log_entry.commit_id, None)
+        if commit_lane_data is not None:
+            commit_lane = lanes.index(commit_lane_data)
+            del lanes[commit_lane]
+            commit_color = commit_lane_data.color
         else: # if not found, it goes into a new lane
             commit_lane = len(lanes)
             commit_color = color_pool.acquire()
-            # calculate by how much we need to shift lanes
         # for every parent not mapped, map it to a lane and shift lanes
         lane_shift = -1
         for parent_id in log_entry.parent_ids:
             if not parent_id in commit_lane_map:
                 lane_shift += 1
-                parent_lane = commit_lane + lane_shift
                 if lane_shift:
                     parent_color = color_pool.acquire()
                 else:
                     parent_color = commit_color
-                lanes.insert(parent_lane, LaneData(parent_id, parent_color))
-                commit_lane_map[parent_id] = parent_lane
-                # release commit color if it wasn't used
+                parent_lane_data = LaneData(parent_id, parent_color)
+                lanes.insert(commit_lane + lane_shift, parent_lane_data)
+                commit_lane_map[parent_id] = parent_lane_data
+        # release commit color if it wasn't used
         if lane_shift < 0:
             color_pool.release(commit_color)
-            # update commit lane map to reflect lane shift
-        if lane_shift:
-            for lane in xrange(commit_lane + lane_shift + 1, len(lanes)):
-                commit_lane_map[lanes[lane].commit_id] = lane
-                # create the list of edges
-        edges = []
+        # a commit continued by its first parent leaves the colors as they were
+        if lane_shift or commit_lane_data is None:
+            self._reset_lane_colors()
         # add parent edges for the current commit
+        parent_edges = []
         for parent_id in log_entry.parent_ids:
-            parent_lane = commit_lane_map[parent_id]
-            edges.append(GraphEdge(
-                commit_lane, parent_lane, lanes[parent_lane].color))
-            # add straight edges for lanes before the current commit
-        for lane in xrange(0, commit_lane):
-            edges.append(GraphEdge(lane, lane, lanes[lane].color))
-            # add possible angled edges for lanes after the current commit
-        for lane in xrange(commit_lane + lane_shift + 1, len(lanes)):
-            edges.append(GraphEdge(lane - lane_shift, lane, lanes[lane].color))
-            # create the row in the commit list
-        prev_row = GraphRow(
-            repo=repo,
+            parent_lane_data = commit_lane_map[parent_id]
+            parent_edges.append(GraphEdge(commit_lane,
+                lanes.index(parent_lane_data), parent_lane_data.color))
+        # straight runs for lanes before the current commit, and possibly
+        # angled ones for lanes after it
+        lane_runs = []
+        if commit_lane:
+            lane_runs.append(self._lane_run(0, commit_lane - 1, 0))
+        if commit_lane + lane_shift + 1 < len(lanes):
+            lane_runs.append(self._lane_run(commit_lane + lane_shift + 1,
+                len(lanes) - 1, lane_shift))
+        # create the row in the commit list
+        row = GraphRow(
+            repo=self.repo,
             log_entry=log_entry,
-            prev_row=prev_row,
+            prev_row=self.rows[-1] if self.rows else None,
             commit_node=GraphNode(lane=commit_lane, color=commit_color),
-            edges=edges)
-        graph.append(prev_row)
-    return graph
+            parent_edges=parent_edges,
+            lane_runs=tuple(lane_runs))
+        self.rows.append(row)
+        return row
+
+    # appends a row laid out earlier, given its (commit_node, parent_edges,
+    # lane_runs), leaving the lanes as they are
+    def add_row(self, log_entry, row_data):
+        commit_node, parent_edges, lane_runs = row_data
+        row = GraphRow(
+            repo=self.repo,
+            log_entry=log_entry,
+            prev_row=self.rows[-1] if self.rows else None,
+            commit_node=commit_node,
+            parent_edges=parent_edges,
+            lane_runs=lane_runs)
+        self.rows.append(row)
+        return row
+
+    def snapshot(self):
+        return (len(self.rows), tuple(self.lanes), dict(self.commit_lane_map),
+            self.color_pool.snapshot())
+
+    def restore(self, snapshot):
+        row_count, lanes, commit_lane_map, color_pool = snapshot
+        del self.rows[row_count:]
+        self.lanes = list(lanes)
+        self.commit_lane_map = dict(commit_lane_map)
+        self.color_pool = ColorPool()
+        self.color_pool.restore(color_pool)
+        self._reset_lane_colors()
 
 
 class ColorPool(object):
@@ -195,6 +640,13 @@ class ColorPool(object):
         else:
             bisect.insort(self.unused, -color)
 
+    def snapshot(self):
+        return self.highest, tuple(self.unused)
+
+    def restore(self, snapshot):
+        self.highest, unused = snapshot
+        self.unused = list(unused)
+
 
 class LogGraphDelegate(QStyledItemDelegate):
     graph_palette = [rgb_color(rgb) for rgb in [
@@ -225,95 +677,131 @@ class LogGraphDelegate(QStyledItemDelegate):
     ref_spacing = 4
     ref_arrow_ratio = 0.25
 
-    @staticmethod
-    def max_edge_lane(edges):
-        if edges:
-            return max(max(edge.from_lane, edge.to_lane) for edge in edges)
-        return 0
-
-    def __init__(self, draw_focus=False, preferred_lane_size=30, parent=None):
+    def __init__(self, draw_focus=False, preferred_lane_size=30,
+            pixmap_cache_size=0, uniform_row_height=False, parent=None):
         QStyledItemDelegate.__init__(self, parent)
         self.draw_focus = draw_focus
         self.preferred_lane_size = preferred_lane_size
-
-    def refs_size(self, option, refs, skip_head):
+        # with uniform row heights, every row is preferred_lane_size high,
+        # and the view never asks for the height of each row
+        self.uniform_row_height = uniform_row_height
+        # cleared when installed in a LogGraphView, which paints the graph
+        # itself, leaving the cells only their background and refs
+        self.paint_cell_graph = True
+        self._font_metrics = {}
+        # pens and paths are built once and reused on every paint
+        self._edge_pens = {}
+        self._edge_paths = {}
+        self._node_pen = QPen(Qt.black, self.node_thickness)
+        self._ref_pen = QPen(Qt.black, self.ref_frame_thickness)
+        self._ref_labels = {}
+        # with a pixmap cache, the last pixmap_cache_size graph cells painted
+        # are kept and drawn as they were
+        self.pixmap_cache_size = pixmap_cache_size
+        self._pixmaps = collections.OrderedDict()
+
+    def edge_pen(self, color):
+        pen = self._edge_pens.get(color)
+        if pen is None:
+            pen = QPen(self.edge_color(color), self.edge_thickness,
+                Qt.SolidLine, Qt.FlatCap, Qt.RoundJoin)
+            self._edge_pens[color] = pen
+        return pen
+
+    def install(self, view):
+        view.setItemDelegate(self)
+        if self.uniform_row_height:
+            header = view.verticalHeader()
+            header.setResizeMode(QHeaderView.Fixed)
+            header.setDefaultSectionSize(self.preferred_lane_size)
+            self.paint_cell_graph = not isinstance(view, LogGraphView)
+
+    def font_metrics(self, font):
+        key = font.key()
+        metrics = self._font_metrics.get(key)
+        if metrics is None:
+            metrics = QFontMetrics(font)
+            self._font_metrics[key] = metrics
+        return metrics
+
+    def edge_path(self, from_lane, to_lane):
+        path = self._edge_paths.get((from_lane, to_lane))
+        if path is None:
+            from_x = from_lane + 0.5
+            to_x = to_lane + 0.5
+            path = QPainterPath()
+            path.moveTo(QPointF(from_x, 0.5))
+            path.cubicTo(from_x, 1.0, to_x, 1.0, to_x, 1.5)
+            self._edge_paths[from_lane, to_lane] = path
+        return path
+
+    def ref_label(self, ref, font):
+        # (width, height) of the label of a (name, type) ref
+        key = (ref, font.key())
+        label = self._ref_labels.get(key)
+        if label is None:
+            text_rect = self.font_metrics(font).boundingRect(0, 0, 0, 0,
+                Qt.AlignLeft | Qt.AlignTop, ref[0])
+            label = (text_rect.width() + self.ref_padding_x,
+                text_rect.height() + self.ref_padding_y)
+            self._ref_labels[key] = label
+        return label
+
+    def refs_size(self, option, refs):
         if not refs:
             return 0, 0
-        metrics = QFontMetrics(option.font)
         width = 0
         height = 0
         for ref in refs:
-            if skip_head and posixpath.basename(ref) == 'HEAD':
-                continue
-            ref_text = git_api.parse_ref(ref)[0]
-            text_rect = metrics.boundingRect(0, 0, 0, 0,
-                Qt.AlignLeft | Qt.AlignTop, ref_text)
-            text_rect.setWidth(text_rect.width() + self.ref_padding_x)
-            text_rect.setHeight(text_rect.height() + self.ref_padding_y)
-            width += text_rect.width()
-            width += text_rect.height() * self.ref_arrow_ratio
+            ref_width, ref_height = self.ref_label(ref, option.font)
+            width += ref_width
+            width += ref_height * self.ref_arrow_ratio
             width += self.ref_spacing
-            height = max(height, text_rect.height())
+            height = max(height, ref_height)
         return width, height
 
     def sizeHint(self, option, index):
         if not isinstance(index.data(), GraphRow):
             return QStyledItemDelegate.sizeHint(self, option, index)
         row = index.data()
-        max_lane = max(row.commit_node.lane, self.max_edge_lane(row.edges))
-        if row.prev_row:
-            max_lane = max(max_lane, self.max_edge_lane(row.prev_row.edges))
-
-        width = (max_lane + 1) * self.preferred_lane_size
+        width = (row.max_lane + 1) * self.preferred_lane_size
         height = self.preferred_lane_size
 
-        refs_width, refs_height = self.refs_size(option, row.log_entry.refs,
-            bool(row.repo.head_ref))
+        refs_width, refs_height = self.refs_size(option, row.refs)
         width += refs_width
-        height = max(height, refs_height)
+        if not self.uniform_row_height:
+            height = max(height, refs_height)
 
         return QSize(width, height)
 
     def draw_edge(self, painter, option, edge, lane_offset):
-        from_y = 0.5 + lane_offset
-        to_y = 1 + from_y
-        pen = QPen(self.edge_color(edge.color), self.edge_thickness,
-            Qt.SolidLine, Qt.FlatCap, Qt.RoundJoin)
-        painter.setPen(pen)
+        painter.setPen(self.edge_pen(edge.color))
         if edge.from_lane == edge.to_lane:
             line_x = edge.from_lane + 0.5
-            painter.drawLine(QPointF(line_x, from_y), QPointF(line_x, to_y))
+            from_y = 0.5 + lane_offset
+            painter.drawLine(QPointF(line_x, from_y),
+                QPointF(line_x, from_y + 1))
         else:
-            from_x = edge.from_lane + 0.5
-            to_x = edge.to_lane + 0.5
-            path = QPainterPath()
-            path.moveTo(QPointF(from_x, from_y))
-            path.cubicTo(from_x, from_y + 0.5, to_x, to_y - 0.5, to_x, to_y)
+            path = self.edge_path(edge.from_lane, edge.to_lane)
+            if lane_offset:
+                path = path.translated(0, lane_offset)
             painter.drawPath(path)
 
     def draw_ref(self, painter, option, ref, repo, x):
-        if repo.head_ref and posixpath.basename(ref) == 'HEAD':
-            return x
-
-        ref_text, ref_type = git_api.parse_ref(ref)
+        ref_text, ref_type = ref
+        width, height = self.ref_label(ref, option.font)
         if ref_type == git_api.REF_BRANCH:
             ref_color = self.ref_palette[ref_type, ref_text == repo.head_ref]
         else:
             ref_color = self.ref_palette.get(ref_type, self.ref_color_default)
 
         lane_size = option.rect.height()
-        painter.setPen(QPen(Qt.black, self.ref_frame_thickness))
+        painter.setPen(self._ref_pen)
         painter.setBrush(QBrush(ref_color))
         painter.setFont(option.font)
 
-        text_rect = painter.boundingRect(0, 0, 0, 0,
-            Qt.AlignLeft | Qt.AlignTop, ref_text)
-        text_rect.translate(-text_rect.x(), -text_rect.y())
-        text_rect.setWidth(text_rect.width() + self.ref_padding_x)
-        text_rect.setHeight(text_rect.height() + self.ref_padding_y)
-        text_rect.translate(
-            x + text_rect.height() * self.ref_arrow_ratio,
-            (lane_size - text_rect.height()) / 2)
+        text_rect = QRectF(x + height * self.ref_arrow_ratio,
+            (lane_size - height) / 2.0, width, height)
         path = QPainterPath()
         path.moveTo(x, lane_size / 2)
         path.lineTo(text_rect.left(), text_rect.top())
@@ -337,8 +825,47 @@ class LogGraphDelegate(QStyledItemDelegate):
 
         has_focus = option.state & QStyle.State_HasFocus
         option.state = option.state & (~QStyle.State_HasFocus)
-        QStyledItemDelegate.paint(self, painter, option, index)
 
+        if self.pixmap_cache_size:
+            painter.drawPixmap(option.rect.topLeft(),
+                self.cached_pixmap(option, index, row))
+        else:
+            QStyledItemDelegate.paint(self, painter, option, index)
+            self.paint_row(painter, option, row)
+
+        if has_focus:
+            painter.save()
+            focus_option = QStyleOptionFocusRect()
+            focus_option.rect = option.rect
+            QApplication.style().drawPrimitive(QStyle.PE_FrameFocusRect,
+                focus_option, painter)
+            painter.restore()
+
+    def cached_pixmap(self, option, index, row):
+        # the row itself is part of the key, since the same commit is laid
+        # out differently in every log
+        key = (row, option.rect.width(), option.rect.height(),
+            option.palette.cacheKey(), int(option.state & (
+                QStyle.State_Selected | QStyle.State_MouseOver |
+                QStyle.State_Active | QStyle.State_Enabled)),
+            row.repo.head_ref, row.refs)
+        pixmap = self._pixmaps.pop(key, None)
+        if pixmap is None:
+            pixmap = QPixmap(option.rect.size())
+            pixmap.fill(Qt.transparent)
+            pixmap_option = QStyleOptionViewItemV4(option)
+            pixmap_option.rect = QRect(QPoint(0, 0), option.rect.size())
+            pixmap_painter = QPainter(pixmap)
+            QStyledItemDelegate.paint(self, pixmap_painter, pixmap_option,
+                index)
+            self.paint_row(pixmap_painter, pixmap_option, row)
+            pixmap_painter.end()
+            if len(self._pixmaps) >= self.pixmap_cache_size:
+                self._pixmaps.popitem(last=False)
+        self._pixmaps[key] = pixmap
+        return pixmap
+
+    def paint_row(self, painter, option, row):
         lane_size = option.rect.height()
 
         painter.save()
@@ -348,42 +875,133 @@ class LogGraphDelegate(QStyledItemDelegate):
         painter.scale(lane_size, lane_size)
         painter.setRenderHint(QPainter.Antialiasing, True)
 
-        max_lane = row.commit_node.lane
-
-        if row.prev_row:
-            for edge in row.prev_row.edges:
-                max_lane = max(max_lane, edge.from_lane, edge.to_lane)
-                self.draw_edge(painter, option, edge, -1)
-        for edge in row.edges:
-            max_lane = max(max_lane, edge.from_lane, edge.to_lane)
-            self.draw_edge(painter, option, edge, 0)
-
-        pen = QPen(Qt.black, self.node_thickness)
-        painter.setPen(pen)
-        painter.setBrush(option.palette.window())
-        painter.drawEllipse(
-            QPointF(row.commit_node.lane + 0.5, 0.5),
-            self.node_radius, self.node_radius)
-
-        if row.log_entry.refs:
+        if self.paint_cell_graph:
+            if row.prev_row:
+                for edge in row.prev_row.edges:
+                    self.draw_edge(painter, option, edge, -1)
+            for edge in row.edges:
+                self.draw_edge(painter, option, edge, 0)
+
+            painter.setPen(self._node_pen)
+            painter.setBrush(option.palette.window())
+            painter.drawEllipse(
+                QPointF(row.commit_node.lane + 0.5, 0.5),
+                self.node_radius, self.node_radius)
+
+        refs = row.refs
+        if refs:
             painter.resetTransform()
             painter.translate(
-                option.rect.x() + (max_lane + 1) * lane_size,
+                option.rect.x() + (row.max_lane + 1) * lane_size,
                 option.rect.y())
 
             ref_x = 0
-            for ref in row.log_entry.refs:
+            for ref in refs:
                 ref_x = self.draw_ref(painter, option, ref, row.repo, ref_x)
 
         painter.restore()
 
-        if has_focus:
-            painter.save()
-            focus_option = QStyleOptionFocusRect()
-            focus_option.rect = option.rect
-            QApplication.style().drawPrimitive(QStyle.PE_FrameFocusRect,
-                focus_option, painter)
-            painter.restore()
+    # Paints the graph of rows shown one below the other in a single pass,
+    # in lane units with the first row at the origin. Every edge of a color
+    # goes into one path, and every node into another. An edge runs from its
+    # row's node to the middle of the next row, so when the next row shown
+    # isn't the next one laid out, as when filtering, only the half of it in
+    # its own row is drawn, and the row below gets the other half.
+    def paint_graph(self, painter, rows, node_brush):
+        edge_paths = collections.defaultdict(QPainterPath)
+        nodes = QPainterPath()
+        node_radius = self.node_radius
+        row_count = len(rows)
+        prev_row = None
+        for y, row in enumerate(rows):
+            if row.prev_row and row.prev_row is not prev_row:
+                self._add_edges(edge_paths, row.prev_row, y - 1, False, True)
+            continued = y + 1 < row_count and rows[y + 1].prev_row is row
+            self._add_edges(edge_paths, row, y, True, continued)
+            nodes.addEllipse(QPointF(row.commit_node.lane + 0.5, y + 0.5),
+                node_radius, node_radius)
+            prev_row = row
+
+        painter.setBrush(Qt.NoBrush)
+        for color, path in edge_paths.iteritems():
+            painter.setPen(self.edge_pen(color))
+            painter.drawPath(path)
+        painter.setPen(self._node_pen)
+        painter.setBrush(node_brush)
+        painter.drawPath(nodes)
+
+    @staticmethod
+    def _add_edges(edge_paths, row, y, upper, lower):
+        # adds the upper and/or lower half of the edges leaving a row at y,
+        # splitting the curves at their middle (de Casteljau)
+        edges = [(edge.from_lane, edge.to_lane, edge.color)
+            for edge in row.parent_edges]
+        for run in row.lane_runs:
+            colors = run.colors
+            shift = run.shift
+            edges.extend((lane - shift, lane, colors[lane])
+                for lane in xrange(run.first_lane, run.last_lane + 1))
+        top = y + 0.5 if upper else y + 1.0
+        bottom = y + 1.5 if lower else y + 1.0
+        for from_lane, to_lane, color in edges:
+            path = edge_paths[color]
+            from_x = from_lane + 0.5
+            to_x = to_lane + 0.5
+            if from_lane == to_lane:
+                path.moveTo(from_x, top)
+                path.lineTo(from_x, bottom)
+            elif upper and lower:
+                path.moveTo(from_x, y + 0.5)
+                path.cubicTo(from_x, y + 1.0, to_x, y + 1.0, to_x, y + 1.5)
+            else:
+                middle_x = (from_x + to_x) / 2
+                if upper:
+                    path.moveTo(from_x, y + 0.5)
+                    path.cubicTo(from_x, y + 0.75,
+                        (3 * from_x + to_x) / 4, y + 0.875, middle_x, y + 1.0)
+                else:
+                    path.moveTo(middle_x, y + 1.0)
+                    path.cubicTo((from_x + 3 * to_x) / 4, y + 1.125,
+                        to_x, y + 1.25, to_x, y + 1.5)
+
+
+# A table view for LogGraphModel, that paints the graph column of all the
+# rows being repainted in one go (see LogGraphDelegate.paint_graph), on top
+# of the cells painted by the delegate. It's only done with uniform row
+# heights; otherwise the delegate paints the graph in each cell.
+@loadable_widget
+class LogGraphView(QTableView):
+    graph_column = 0
+
+    def paintEvent(self, event):
+        super(LogGraphView, self).paintEvent(event)
+        delegate = self.itemDelegate()
+        if not isinstance(delegate, LogGraphDelegate) or \
+                delegate.paint_cell_graph:
+            return
+        if self.isColumnHidden(self.graph_column): return
+        model = self.model()
+        if not model: return
+        rect = event.rect()
+        first_row = self.rowAt(rect.top())
+        if first_row < 0: return
+        last_row = self.rowAt(rect.bottom())
+        if last_row < 0:
+            last_row = model.rowCount(QModelIndex()) - 1
+        rows = [model.index(row, self.graph_column, QModelIndex()).data()
+            for row in xrange(first_row, last_row + 1)]
+        if not all(isinstance(row, GraphRow) for row in rows): return
+
+        lane_size = self.rowHeight(first_row)
+        column_x = self.columnViewportPosition(self.graph_column)
+        painter = QPainter(self.viewport())
+        painter.setClipRect(rect.intersected(QRect(column_x, rect.top(),
+            self.columnWidth(self.graph_column), rect.height())))
+        painter.translate(column_x, self.rowViewportPosition(first_row))
+        painter.scale(lane_size, lane_size)
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        delegate.paint_graph(painter, rows, self.palette().window())
+        painter.end()
 
 
 @loadable_widget
@@ -392,6 +1010,10 @@ class LogFilter(QFrame):
         super(LogFilter, self).__init__(parent=parent)
         setup_ui(self)
         self.filter_model = FilterModel(parent=self)
+        # the search index works with row numbers
+        self.filter_model.row_items_getter = lambda model, first, last: \
+            xrange(first, last + 1)
+        self.search_matches = SearchMatches(lambda: self.source_model)
         self._viewer = None
         self.revs_menu = QMenu(parent=self)
         self.revs_separator = None
@@ -402,6 +1024,8 @@ class LogFilter(QFrame):
         self.action_all_refs.triggered.connect(self.show_all_refs)
         self.action_select_branches.triggered.connect(self.pick_branches)
         self.filter_text.textEdited.connect(self.filter_text_edited)
+        self.filter_text.returnPressed.connect(self.apply_git_filter)
+        self.git_filter_button.toggled.connect(self.git_filter_toggled)
 
     @property
     def source_model(self):
@@ -409,7 +1033,20 @@ class LogFilter(QFrame):
 
     @source_model.setter
     def source_model(self, model):
+        old_model = self.source_model
+        if old_model:
+            old_model.loading_progress.disconnect(self.loading_progress)
+            old_model.loading_finished.disconnect(self.loading_finished)
+            old_model.modelReset.disconnect(self.reset_search)
+        model.modelReset.connect(self.reset_search)
+        self.reset_search()
         self.filter_model.setSourceModel(model)
+        model.loading_progress.connect(self.loading_progress)
+        model.loading_finished.connect(self.loading_finished)
+        if model.loading:
+            self.loading_progress(len(model.graph))
+        else:
+            self.loading_finished()
         self.revs_menu.clear()
         for action in self.rev_actions.actions():
             if action is not self.action_all_refs:
@@ -436,6 +1073,14 @@ class LogFilter(QFrame):
         self.revs_separator = self.revs_menu.addSeparator()
         self.revs_menu.addAction(self.action_select_branches)
 
+    def loading_progress(self, row_count):
+        self.loading_indicator.setToolTip(
+            self.tr('Loading history: %d commits') % row_count)
+        self.loading_indicator.show()
+
+    def loading_finished(self):
+        self.loading_indicator.hide()
+
     @property
     def viewer(self):
         return self._viewer
@@ -456,15 +1101,15 @@ class LogFilter(QFrame):
 
     def show_all_refs(self):
         self._select_action(self.action_all_refs)
-        with busy_cursor():
-            self.source_model.revs = ()
-            self.source_model.all = True
-            self.source_model.refresh()
+        self.source_model.revs = ()
+        self.source_model.all = True
+        self.source_model.refresh()
 
     def pick_branches(self):
         dialog = PickBranchesDialog(repo=self.source_model.repo, parent=self)
         if dialog.exec_() == dialog.Accepted:
             self.show_revs(*dialog.selected_branches)
+        dialog.deleteLater()
 
     def _select_action(self, action):
         action.setChecked(True)
@@ -472,10 +1117,9 @@ class LogFilter(QFrame):
 
     def _revs_action_triggered(self):
         self._select_action(self.sender())
-        with busy_cursor():
-            self.source_model.revs = self.sender().revs
-            self.source_model.all = False
-            self.source_model.refresh()
+        self.source_model.revs = self.sender().revs
+        self.source_model.all = False
+        self.source_model.refresh()
 
     def _find_rev_action(self, revs):
         return next((action for action in self.rev_actions.actions()
@@ -487,18 +1131,103 @@ class LogFilter(QFrame):
             action = self.create_rev_action(self.source_model.repo, *revs)
             self.revs_menu.insertAction(self.revs_separator, action)
         self._select_action(action)
-        with busy_cursor():
-            self.source_model.revs = revs
-            self.source_model.all = False
-            self.source_model.refresh()
+        self.source_model.revs = revs
+        self.source_model.all = False
+        self.source_model.refresh()
+
+    # In git filter mode, the query is run by git when enter is pressed, and
+    # only the matching commits are loaded. Otherwise, the loaded commits are
+    # filtered as the query is typed.
+    def git_filter_toggled(self, checked):
+        if checked:
+            self.filter_text_edited('')
+            self.apply_git_filter()
+        else:
+            if self.source_model.log_filters or \
+                    self.source_model.filter_paths:
+                self.source_model.log_filters = {}
+                self.source_model.filter_paths = ()
+                self.source_model.refresh()
+            self.filter_text_edited(self.filter_text.text())
+
+    def apply_git_filter(self):
+        if not self.git_filter_button.isChecked(): return
+        log_filters, filter_paths = parse_git_query(
+            self.filter_text.text().encode('utf-8'))
+        self.source_model.log_filters = log_filters
+        self.source_model.filter_paths = filter_paths
+        self.source_model.refresh()
 
     def filter_text_edited(self, text):
-        if text:
+        if self.git_filter_button.isChecked():
+            text = ''
+        terms = parse_query(text.encode('utf-8'))
+        was_filtering = bool(self.search_matches.terms)
+        self.search_matches.search(terms)
+        if terms:
             self.viewer.hideColumn(0)
-            self.filter_model.filters += self.filter_graph_row
-        else:
-            self.filter_model.filters -= self.filter_graph_row
+            self.filter_model.filters += self.search_matches
+        elif was_filtering:
+            self.filter_model.filters -= self.search_matches
             self.viewer.showColumn(0)
 
-    def filter_graph_row(self, graph_row):
-        return commit_matches_text(graph_row.log_entry, self.filter_text.text())
+    def reset_search(self):
+        # the matches are searched again as rows get filtered
+        self.search_matches.reset()
+
+
+# The rows of a LogGraphModel matching a query, as found in its search index
+# (see CommitSearchIndex). It's a filter for FilterModel, taking the ranges of
+# row numbers given by LogFilter's row_items_getter: the rows are also kept
+# sorted, so that select() flags the ones within a range by bisection, without
+# looking at every row (see FilterSet.select). Rows loaded after the query
+# was searched are searched once they're filtered.
+class SearchMatches(object):
+    def __init__(self, model_getter):
+        self.model_getter = model_getter
+        self.terms = ()
+        self.reset()
+
+    def reset(self):
+        self.rows = set()
+        self.sorted_rows = []
+        self.searched_rows = 0
+
+    def search(self, terms):
+        search_index = self.model_getter().search_index
+        if terms and self.terms and narrows(self.terms, terms):
+            # only the commits that matched so far need to be checked again,
+            # along with any loaded since
+            rows = search_index.search(terms, candidates=self.rows)
+            rows.update(search_index.search(terms,
+                first_row=self.searched_rows))
+        else:
+            rows = search_index.search(terms)
+        self.terms = terms
+        self.rows = rows
+        self.sorted_rows = sorted(rows)
+        self.searched_rows = search_index.row_count
+
+    def _search_loaded_rows(self, last_row):
+        if last_row < self.searched_rows: return
+        search_index = self.model_getter().search_index
+        rows = sorted(search_index.search(self.terms,
+            first_row=self.searched_rows))
+        self.rows.update(rows)
+        self.sorted_rows.extend(rows)
+        self.searched_rows = search_index.row_count
+
+    def __call__(self, row):
+        self._search_loaded_rows(row)
+        return row in self.rows
+
+    def select(self, rows):
+        flags = bytearray(len(rows))
+        if not rows: return flags
+        first, last = rows[0], rows[-1]
+        self._search_loaded_rows(last)
+        start = bisect.bisect_left(self.sorted_rows, first)
+        end = bisect.bisect_right(self.sorted_rows, last)
+        for row in self.sorted_rows[start:end]:
+            flags[row - first] = 1
+        return flags
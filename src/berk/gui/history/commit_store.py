@@ -0,0 +1,365 @@
+import array
+import binascii
+import datetime
+import itertools
+import threading
+
+import dateutil.tz
+
+import git_api
+
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=dateutil.tz.tzutc())
+_timezones = {}
+
+def _pack_date(date):
+    return (int((date - _EPOCH).total_seconds()),
+        int(date.utcoffset().total_seconds()) // 60)
+
+def _unpack_date(timestamp, offset):
+    timezone = _timezones.get(offset)
+    if timezone is None:
+        timezone = _timezones[offset] = dateutil.tz.tzoffset(None, offset * 60)
+    return datetime.datetime.fromtimestamp(timestamp, timezone)
+
+
+# Commits stored column by column, instead of as a LogEntry each: ids and
+# parent ids are packed into binary buffers, names and emails are kept once
+# per identity, dates are timestamps and minute offsets, and messages are
+# lines ending in '\n' in one buffer. entry() returns a CommitView, which
+# decodes fields as they are accessed.
+#
+# A commit may be added with only its subject line as message (complete is
+# False), and gets its full message once it's added again complete, or given
+# to set_message(). Otherwise, adding a commit again changes nothing.
+# The buffers are only ever appended to, so views stay valid.
+#
+# Writers are expected to be serialized by the caller, but a commit's message
+# may be read while another thread sets it: its bounds and complete flag are
+# only changed and read together under message_lock, once the text is in
+# place.
+class CommitTable(object):
+    def __init__(self):
+        self.positions = {}
+        self.ids = bytearray()
+        self.identities = []
+        self.identity_positions = {}
+        self.authors = array.array('i')
+        self.committers = array.array('i')
+        self.author_times = array.array('l')
+        self.author_offsets = array.array('h')
+        self.committer_times = array.array('l')
+        self.committer_offsets = array.array('h')
+        self.parent_ends = array.array('l')
+        self.parents = bytearray()
+        self.message_starts = array.array('l')
+        self.message_ends = array.array('l')
+        self.messages = bytearray()
+        self.complete = bytearray()
+        self.message_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, commit_id):
+        return binascii.unhexlify(commit_id) in self.positions
+
+    def _identity(self, name, email):
+        identity = (name, email)
+        position = self.identity_positions.get(identity)
+        if position is None:
+            position = len(self.identities)
+            self.identities.append(identity)
+            self.identity_positions[identity] = position
+        return position
+
+    def add(self, log_entry, complete=True):
+        packed_id = binascii.unhexlify(log_entry.commit_id)
+        position = self.positions.get(packed_id)
+        if position is None:
+            position = len(self.positions)
+            self.ids.extend(packed_id)
+            self.authors.append(self._identity(log_entry.author_name,
+                log_entry.author_email))
+            self.committers.append(self._identity(log_entry.committer_name,
+                log_entry.committer_email))
+            timestamp, offset = _pack_date(log_entry.author_date)
+            self.author_times.append(timestamp)
+            self.author_offsets.append(offset)
+            timestamp, offset = _pack_date(log_entry.committer_date)
+            self.committer_times.append(timestamp)
+            self.committer_offsets.append(offset)
+            for parent_id in log_entry.parent_ids:
+                self.parents.extend(binascii.unhexlify(parent_id))
+            self.parent_ends.append(len(self.parents))
+            self.message_starts.append(0)
+            self.message_ends.append(0)
+            self.complete.append(False)
+            self.set_message(position, log_entry.message, complete)
+            # only visible once everything else is in place
+            self.positions[packed_id] = position
+        elif complete and not self.is_complete(position):
+            self.set_message(position, log_entry.message)
+        return CommitView(self, position)
+
+    def entry(self, commit_id):
+        return CommitView(self, self.positions[binascii.unhexlify(commit_id)])
+
+    def position(self, commit_id):
+        return self.positions.get(binascii.unhexlify(commit_id))
+
+    def set_message(self, position, message, complete=True):
+        start = len(self.messages)
+        if message:
+            self.messages.extend('\n'.join(message))
+            self.messages.append('\n')
+        with self.message_lock:
+            self.message_starts[position] = start
+            self.message_ends[position] = len(self.messages)
+            self.complete[position] = complete
+
+    def message_bounds(self, position):
+        with self.message_lock:
+            return self.message_starts[position], self.message_ends[position]
+
+    def is_complete(self, position):
+        with self.message_lock:
+            return self.complete[position]
+
+
+class CommitView(object):
+    __slots__ = ('table', 'position', 'replaced_parent_ids')
+
+    _fields = git_api.LogEntry._fields
+
+    def __init__(self, table, position, parent_ids=None):
+        self.table = table
+        self.position = position
+        self.replaced_parent_ids = parent_ids
+
+    @property
+    def commit_id(self):
+        start = self.position * 20
+        return binascii.hexlify(self.table.ids[start:start + 20])
+
+    @property
+    def parent_ids(self):
+        if self.replaced_parent_ids is not None:
+            return self.replaced_parent_ids
+        table = self.table
+        start = table.parent_ends[self.position - 1] if self.position else 0
+        parents = table.parents[start:table.parent_ends[self.position]]
+        return tuple(binascii.hexlify(parents[offset:offset + 20])
+            for offset in xrange(0, len(parents), 20))
+
+    @property
+    def author_name(self):
+        return self.table.identities[self.table.authors[self.position]][0]
+
+    @property
+    def author_email(self):
+        return self.table.identities[self.table.authors[self.position]][1]
+
+    @property
+    def author_date(self):
+        return _unpack_date(self.table.author_times[self.position],
+            self.table.author_offsets[self.position])
+
+    @property
+    def committer_name(self):
+        return self.table.identities[self.table.committers[self.position]][0]
+
+    @property
+    def committer_email(self):
+        return self.table.identities[self.table.committers[self.position]][1]
+
+    @property
+    def committer_date(self):
+        return _unpack_date(self.table.committer_times[self.position],
+            self.table.committer_offsets[self.position])
+
+    @property
+    def message(self):
+        start, end = self.table.message_bounds(self.position)
+        text = str(self.table.messages[start:end])
+        return tuple(text[:-1].split('\n')) if text else ()
+
+    def to_log_entry(self):
+        table = self.table
+        position = self.position
+        author = table.identities[table.authors[position]]
+        committer = table.identities[table.committers[position]]
+        return git_api.LogEntry(self.commit_id, self.parent_ids,
+            author[0], author[1], self.author_date,
+            committer[0], committer[1], self.committer_date, self.message)
+
+    def _replace(self, **kwargs):
+        if kwargs.keys() == ['parent_ids']:
+            return CommitView(self.table, self.position, kwargs['parent_ids'])
+        return self.to_log_entry()._replace(**kwargs)
+
+    def __iter__(self):
+        return iter(self.to_log_entry())
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    # pickled as a plain LogEntry, since the table isn't
+    def __reduce__(self):
+        return git_api.LogEntry, tuple(self)
+
+
+# Holds the commits read for a repo, so that every log of it shares them.
+# Stores are reference counted: acquire() returns the repo's store, creating
+# it if needed, and it's dropped once everyone has called release().
+#
+# A log is projected from the store by listing its commits and their parents
+# with git rev-list, and only the commits not in the store yet are read with
+# git log. The parents listed replace the stored ones, since paths rewrite
+# them.
+#
+# Logs may be read with subject_only, leaving the rest of the messages to be
+# read when needed, with a git cat-file process kept running by the store.
+class CommitStore(object):
+    stores = {}
+    # commits are listed and read this many at a time
+    chunk_size = 2000
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.commits = CommitTable()
+        self.ref_count = 0
+        self._lock = threading.Lock()
+        self._cat_file = None
+        self._cat_file_lock = threading.Lock()
+        self._commit_graph_tips = None
+
+    @classmethod
+    def acquire(cls, repo):
+        store = cls.stores.get(repo)
+        if store is None:
+            store = cls.stores[repo] = cls(repo)
+        store.ref_count += 1
+        return store
+
+    def release(self):
+        self.ref_count -= 1
+        if not self.ref_count:
+            del CommitStore.stores[self.repo]
+            with self._cat_file_lock:
+                if self._cat_file:
+                    self._cat_file.close()
+                    self._cat_file = None
+
+    def _git(self, method, **kwargs):
+        return method(self.repo.work_tree_dir, self.repo.git_dir, **kwargs)
+
+    def __len__(self):
+        return len(self.commits)
+
+    def add(self, log_entries, complete=True):
+        with self._lock:
+            for log_entry in log_entries:
+                if isinstance(log_entry, CommitView) and \
+                        log_entry.table is self.commits:
+                    continue
+                self.commits.add(log_entry, complete)
+
+    # Adds a single commit, and returns its CommitView. Holding on to the view
+    # rather than to log_entry keeps only the store's copy of the commit.
+    def add_commit(self, log_entry, complete=True):
+        if isinstance(log_entry, CommitView) and \
+                log_entry.table is self.commits:
+            return log_entry
+        with self._lock:
+            return self.commits.add(log_entry, complete)
+
+    def get(self, commit_ids, subject_only=False):
+        missing = [commit_id for commit_id in commit_ids
+            if commit_id not in self.commits]
+        if missing:
+            self.add(self._git(self.repo.git.log_commits, commit_ids=missing,
+                subject_only=subject_only), not subject_only)
+        if not subject_only:
+            self.load_messages(commit_ids)
+        return [self.commits.entry(commit_id) for commit_id in commit_ids]
+
+    def _incomplete(self, commit_ids):
+        commits = self.commits
+        return [commit_id for commit_id in commit_ids
+            if not commits.is_complete(commits.position(commit_id))]
+
+    def _read_messages(self, commit_ids):
+        with self._cat_file_lock:
+            if self._cat_file is None:
+                self._cat_file = self._git(self.repo.git.cat_file)
+            objects = list(self._cat_file.read(commit_ids))
+        return dict((commit_id, git_api.parse_commit_message(data))
+            for commit_id, object_type, data in objects
+            if object_type == 'commit')
+
+    def load_messages(self, commit_ids):
+        # reads the full message of stored commits that only have a subject
+        incomplete = self._incomplete(commit_ids)
+        if not incomplete: return
+        messages = self._read_messages(incomplete)
+        commits = self.commits
+        with self._lock:
+            for commit_id, message in messages.iteritems():
+                commits.set_message(commits.position(commit_id), message)
+
+    # The full messages of stored commits, in the same order, without storing
+    # the ones read for commits that only have a subject
+    def messages(self, commit_ids):
+        incomplete = self._incomplete(commit_ids)
+        read = self._read_messages(incomplete) if incomplete else {}
+        return [read[commit_id] if commit_id in read
+            else self.commits.entry(commit_id).message
+            for commit_id in commit_ids]
+
+    # Path-limited logs rely on git's commit-graph and its changed-path Bloom
+    # filters (see git_api.Git.write_commit_graph), which are brought up to
+    # date with the commits new since refs last moved, unless the repo's
+    # commit_graph setting says otherwise (see Repo).
+    def update_commit_graph(self):
+        if not self._writes_commit_graph(): return
+        ref_tips = self._git(self.repo.git.ref_tips)
+        with self._lock:
+            if ref_tips == self._commit_graph_tips: return
+            self._commit_graph_tips = ref_tips
+        try:
+            self._git(self.repo.git.write_commit_graph)
+        except git_api.GitCommandError:
+            # such as another git writing it at the same time
+            with self._lock:
+                self._commit_graph_tips = None
+
+    def _writes_commit_graph(self):
+        if self.repo.commit_graph is not None:
+            return self.repo.commit_graph
+        return self._git(self.repo.git.get_config, name='core.commitGraph',
+            as_bool=True) is not False
+
+    def log(self, revs=None, paths=None, all=False, subject_only=False):
+        if not self.commits:
+            for log_entry in self.repo.log(revs=revs, paths=paths, all=all,
+                    subject_only=subject_only):
+                commit = self.add_commit(log_entry, not subject_only)
+                if commit.parent_ids != log_entry.parent_ids:
+                    commit = commit._replace(parent_ids=log_entry.parent_ids)
+                yield commit
+            return
+        commits = self.repo.rev_list(revs=revs, paths=paths, all=all)
+        while True:
+            chunk = list(itertools.islice(commits, self.chunk_size))
+            if not chunk: return
+            log_entries = self.get([commit_id for commit_id, _ in chunk],
+                subject_only)
+            for log_entry, (_, parent_ids) in itertools.izip(log_entries,
+                    chunk):
+                if log_entry.parent_ids != parent_ids:
+                    log_entry = log_entry._replace(parent_ids=parent_ids)
+                yield log_entry
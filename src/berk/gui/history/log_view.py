@@ -1,4 +1,4 @@
-from berk.gui import busy_cursor, View
+from berk.gui import View
 from berk.gui.history import create_log_graph, LogGraphModel, LogGraphDelegate
 
 from PySide.QtCore import Qt
@@ -15,9 +15,9 @@ class LogView(View):
 
     def create_ui(self):
         super(LogView, self).create_ui()
-        with busy_cursor():
-            self.graph_model = LogGraphModel(self.repo, paths=self.paths,
-                revs=self.revs, all=self.all, parent=self)
-        self.graph_table.setItemDelegate(LogGraphDelegate())
+        self.graph_model = LogGraphModel(self.repo, paths=self.paths,
+            revs=self.revs, all=self.all, subject_only=True, parent=self)
+        LogGraphDelegate(pixmap_cache_size=512, uniform_row_height=True,
+            parent=self).install(self.graph_table)
         self.log_filter.source_model = self.graph_model
         self.log_filter.viewer = self.graph_table
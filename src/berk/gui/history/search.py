@@ -0,0 +1,175 @@
+import bisect
+
+
+# A query is matched against all of a commit's text, except for terms like
+# author:name, which only look at that field. sha: terms match id prefixes.
+FIELDS = ('author', 'committer', 'sha')
+_PREFIX_FIELDS = frozenset(('sha',))
+
+
+def parse_query(query):
+    terms = []
+    text = []
+    for word in query.lower().split(' '):
+        field, colon, needle = word.partition(':')
+        if colon and field in FIELDS:
+            if needle:
+                terms.append((field, needle))
+        else:
+            text.append(word)
+    text = ' '.join(text).strip()
+    if text:
+        terms.insert(0, ('text', text))
+    return tuple(terms)
+
+
+def narrows(old_terms, new_terms):
+    # whether every commit matching new_terms also matches old_terms
+    def extends(new_term, old_term):
+        new_field, new_needle = new_term
+        old_field, old_needle = old_term
+        if new_field != old_field:
+            return False
+        if new_field in _PREFIX_FIELDS:
+            return new_needle.startswith(old_needle)
+        return old_needle in new_needle
+    return all(any(extends(new_term, old_term) for new_term in new_terms)
+        for old_term in old_terms)
+
+
+# Filters run by git itself, see git_api.Git.log. The text of the query is
+# matched against commit messages.
+GIT_FIELDS = {
+    'author': 'author',
+    'committer': 'committer',
+    'since': 'since',
+    'until': 'until',
+    's': 'pickaxe',
+    'g': 'pickaxe_regex',
+}
+
+
+def parse_git_query(query):
+    log_filters = {}
+    paths = []
+    text = []
+    for word in query.split(' '):
+        field, colon, value = word.partition(':')
+        field = field.lower()
+        if colon and field == 'path':
+            if value:
+                paths.append(value)
+        elif colon and field in GIT_FIELDS:
+            if value:
+                log_filters[GIT_FIELDS[field]] = value
+        else:
+            text.append(word)
+    text = ' '.join(text).strip()
+    if text:
+        log_filters['grep'] = text
+    if log_filters:
+        log_filters['ignore_case'] = True
+    return log_filters, tuple(paths)
+
+
+def commit_fields(log_entry, refs=()):
+    text = [log_entry.commit_id]
+    text.extend(name for name, ref_type in refs)
+    text.extend(log_entry.parent_ids)
+    text.extend((log_entry.author_name, log_entry.author_email,
+        str(log_entry.author_date), log_entry.committer_name,
+        log_entry.committer_email, str(log_entry.committer_date)))
+    text.extend(log_entry.message)
+    return dict(
+        text='\0'.join(text),
+        author='%s <%s>' % (log_entry.author_name, log_entry.author_email),
+        committer='%s <%s>' % (log_entry.committer_name,
+            log_entry.committer_email),
+        sha=log_entry.commit_id)
+
+
+# The lowered text of a batch of commits, kept as one string per field with
+# every commit starting with a NUL. Searching it is a str.find() scan, and
+# the offsets map the hits back to rows. The names of refs are taken from
+# ref_map (see Repo.ref_map) as it is when the chunk is built.
+class SearchChunk(object):
+    def __init__(self, log_entries, ref_map=None):
+        ref_map = ref_map or {}
+        values = dict((field, []) for field in ('text',) + FIELDS)
+        for log_entry in log_entries:
+            refs = ref_map.get(log_entry.commit_id, ())
+            for field, value in commit_fields(log_entry, refs).iteritems():
+                values[field].append(value)
+        self.size = len(log_entries)
+        self.texts = {}
+        self.offsets = {}
+        for field, field_values in values.iteritems():
+            offsets = []
+            offset = 0
+            for value in field_values:
+                offsets.append(offset)
+                offset += len(value) + 1
+            self.offsets[field] = offsets
+            self.texts[field] = ''.join('\0' + value
+                for value in field_values).lower()
+
+    def find(self, field, needle):
+        text = self.texts[field]
+        offsets = self.offsets[field]
+        if field in _PREFIX_FIELDS:
+            needle = '\0' + needle
+        rows = []
+        pos = text.find(needle)
+        while pos >= 0:
+            row = bisect.bisect_right(offsets, pos) - 1
+            rows.append(row)
+            if row + 1 >= len(offsets): break
+            pos = text.find(needle, offsets[row + 1])
+        return rows
+
+    def row_matches(self, field, needle, row):
+        text = self.texts[field]
+        offsets = self.offsets[field]
+        start = offsets[row]
+        end = offsets[row + 1] if row + 1 < len(offsets) else len(text)
+        if field in _PREFIX_FIELDS:
+            return text.startswith('\0' + needle, start, end)
+        return text.find(needle, start, end) >= 0
+
+
+class CommitSearchIndex(object):
+    def __init__(self):
+        self.chunks = []
+        self.chunk_starts = []
+        self.row_count = 0
+
+    def add(self, chunk):
+        self.chunks.append(chunk)
+        self.chunk_starts.append(self.row_count)
+        self.row_count += chunk.size
+
+    # Returns the set of matching rows, out of candidates if given, or else
+    # out of the rows from first_row on
+    def search(self, terms, first_row=0, candidates=None):
+        if not terms:
+            return set()
+        if candidates is not None:
+            return set(row for row in candidates
+                if self._row_matches(terms, row))
+        (first_field, first_needle), other_terms = terms[0], terms[1:]
+        matches = set()
+        for start, chunk in zip(self.chunk_starts, self.chunks):
+            if start + chunk.size <= first_row: continue
+            for row in chunk.find(first_field, first_needle):
+                if start + row < first_row: continue
+                if all(chunk.row_matches(field, needle, row)
+                        for field, needle in other_terms):
+                    matches.add(start + row)
+        return matches
+
+    def _row_matches(self, terms, row):
+        chunk_idx = bisect.bisect_right(self.chunk_starts, row) - 1
+        chunk = self.chunks[chunk_idx]
+        row -= self.chunk_starts[chunk_idx]
+        return all(chunk.row_matches(field, needle, row)
+            for field, needle in terms)
@@ -1,4 +1,4 @@
-from berk.gui import busy_cursor, Dialog, model_item
+from berk.gui import Dialog, model_item
 from berk.gui.history import LogGraphDelegate, LogGraphModel
 
 from PySide.QtGui import QDialogButtonBox
@@ -10,11 +10,11 @@ class SelectCommitDialog(Dialog):
         self.files = files
         self.revs = revs
         self.all = all
-        with busy_cursor():
-            self.graph_model = LogGraphModel(self.repo,
-                paths=[f.path for f in self.files], revs=self.revs,
-                all=self.all, parent=self)
-        self.graph_table.setItemDelegate(LogGraphDelegate())
+        self.graph_model = LogGraphModel(self.repo,
+            paths=[f.path for f in self.files], revs=self.revs, all=self.all,
+            subject_only=True, parent=self)
+        LogGraphDelegate(uniform_row_height=True,
+            parent=self).install(self.graph_table)
         self.log_filter.source_model = self.graph_model
         self.log_filter.viewer = self.graph_table
         self.dialog_buttons.button(QDialogButtonBox.Ok).setEnabled(False)
@@ -27,7 +27,8 @@ class SelectCommitDialog(Dialog):
     @property
     def selected_commit(self):
         selected_row = model_item(self.graph_table.currentIndex())
-        return selected_row.log_entry if selected_row else None
+        return self.graph_model.full_entry(selected_row) if selected_row \
+            else None
 
     def commit_clicked(self, index, old_index):
         self.dialog_buttons.button(QDialogButtonBox.Ok).setEnabled(bool(
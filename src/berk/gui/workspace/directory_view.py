@@ -1,5 +1,5 @@
 from berk.model import Repo
-from berk.gui import connect_destructor, View
+from berk.gui import busy_cursor, connect_destructor, run_in_background, View
 from berk.gui import model_item
 
 from PySide.QtCore import QAbstractItemModel, QModelIndex, Qt
@@ -16,12 +16,18 @@ class DirectoryModel(QAbstractItemModel):
         self.workspace.repo_added += self.repo_added
         self.workspace.before_repo_refreshed += self.before_repo_refreshed
         self.workspace.repo_refreshed += self.repo_refreshed
+        self.workspace.before_directory_loaded += self.before_directory_loaded
+        self.workspace.directory_loaded += self.directory_loaded
+        self._inserting_dirs = False
+        self._loading_repos = set()
 
     def _destroyed(self):
         self.workspace.before_repo_added -= self.before_repo_added
         self.workspace.repo_added -= self.repo_added
         self.workspace.before_repo_refreshed -= self.before_repo_refreshed
         self.workspace.repo_refreshed -= self.repo_refreshed
+        self.workspace.before_directory_loaded -= self.before_directory_loaded
+        self.workspace.directory_loaded -= self.directory_loaded
 
     def model_item(self, index):
         return index.internalPointer()
@@ -39,6 +45,48 @@ class DirectoryModel(QAbstractItemModel):
     def repo_refreshed(self, repo):
         self.endResetModel()
 
+    def before_directory_loaded(self, directory, dirs, files):
+        self._inserting_dirs = bool(dirs)
+        if self._inserting_dirs:
+            self.beginInsertRows(self.item_index(directory), 0, len(dirs) - 1)
+
+    def directory_loaded(self, directory):
+        if self._inserting_dirs:
+            self._inserting_dirs = False
+            self.endInsertRows()
+
+    def hasChildren(self, parent):
+        if not parent.isValid():
+            return bool(self.workspace.repos)
+        parent_dir = model_item(parent)
+        return not parent_dir.loaded or bool(parent_dir.dirs)
+
+    def canFetchMore(self, parent):
+        if not parent.isValid():
+            return False
+        item = model_item(parent)
+        return not item.loaded and item not in self._loading_repos
+
+    def fetchMore(self, parent):
+        directory = model_item(parent)
+        if isinstance(directory, Repo):
+            # lazy repos are scanned in the background, so that several of
+            # them can load at once
+            self._loading_repos.add(directory)
+            run_in_background(directory.scan,
+                lambda scan: self._repo_scanned(directory, scan))
+            return
+        with busy_cursor():
+            directory.repo.load_directory(directory)
+
+    def _repo_scanned(self, repo, scan):
+        if not (repo.apply_scan(scan) or repo.loaded):
+            # overtaken by a change to the repo, so it's scanned again
+            run_in_background(repo.scan,
+                lambda scan: self._repo_scanned(repo, scan))
+            return
+        self._loading_repos.discard(repo)
+
     def rowCount(self, parent):
         if not parent.isValid():
             return len(self.workspace.repos)
@@ -156,6 +204,9 @@ class DirectoryView(View):
             self.parent().item_selection_changed.emit([])
 
     def dir_selected(self, index, old_index):
+        # the file view needs the selected directory's contents
+        if self.dir_model.canFetchMore(index):
+            self.dir_model.fetchMore(index)
         slave_view = self.parent().file_view
         if slave_view:
             directory = model_item(index)
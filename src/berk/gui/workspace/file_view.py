@@ -1,7 +1,7 @@
 import git_api
 
-from berk.gui import connect_destructor, FileIconProvider, FilterModel, \
-    model_item, View
+from berk.gui import connect_destructor, contiguous_ranges, FileIconProvider, \
+    FilterModel, model_item, View
 from berk.gui.workspace import apply_status_to_icon, deep_file_list, \
     exclude_ignored, exclude_unmodified, exclude_untracked, shallow_file_list, \
     status_text
@@ -24,15 +24,16 @@ class FileModel(QAbstractTableModel):
         self.workspace = workspace
         self._file_source = None
         self._files = None
+        self._rows = {}
         self.column_names = [self.tr('Name'), self.tr('Index Status'),
             self.tr('Work Tree Status'), self.tr('Full Path')]
         self.icon_provider = FileIconProvider()
-        workspace.item_updated += self.item_updated
+        workspace.items_updated += self.items_updated
         workspace.before_repo_refreshed += self.before_repo_refreshed
         workspace.repo_refreshed += self.repo_refreshed
 
     def _destroyed(self):
-        self.workspace.item_updated -= self.item_updated
+        self.workspace.items_updated -= self.items_updated
         self.workspace.before_repo_refreshed -= self.before_repo_refreshed
         self.workspace.repo_refreshed -= self.repo_refreshed
 
@@ -58,23 +59,30 @@ class FileModel(QAbstractTableModel):
     def _refresh_files(self):
         files = self.file_source()
         self._files = tuple(files) if files else None
+        self._rows = dict((item, row)
+            for row, item in enumerate(self._files or ()))
 
     def model_item(self, index):
         if not (self.files and index.isValid()): return None
         return self.files[index.row()]
 
+    def model_items(self, first, last):
+        return self.files[first:last + 1] if self.files else ()
+
     def item_is_mine(self, item):
-        return item and self.files and item in self.files
+        return item in self._rows
 
     def item_index(self, item, column=0):
         if not self.item_is_mine(item):
             return QModelIndex()
-        return self.createIndex(self.files.index(item), column, None)
+        return self.createIndex(self._rows[item], column, None)
 
-    def item_updated(self, item):
-        if not self.item_is_mine(item): return
-        self.dataChanged.emit(self.item_index(item),
-            self.item_index(item, len(self.column_names) - 1))
+    def items_updated(self, items):
+        rows = set(self._rows[item] for item in items if item in self._rows)
+        last_column = len(self.column_names) - 1
+        for first, last in contiguous_ranges(rows):
+            self.dataChanged.emit(self.createIndex(first, 0, None),
+                self.createIndex(last, last_column, None))
 
     def before_repo_refreshed(self, repo):
         if self.files and any(file.repo is repo for file in self.files):
@@ -153,6 +161,12 @@ class FileView(View):
         selection_model.selectionChanged.connect(self.item_selection_changed)
         self.app.view_focus_out[self] += self.lost_focus
         self.app.view_focus_in[self] += self.gained_focus
+        workspace.directory_loaded += self.directory_loaded
+
+    def _destroyed(self):
+        self.app.view_focus_out[self] -= self.lost_focus
+        self.app.view_focus_in[self] -= self.gained_focus
+        self.app.workspace.directory_loaded -= self.directory_loaded
 
     def on_added_to_window(self):
         super(FileView, self).on_added_to_window()
@@ -185,6 +199,16 @@ class FileView(View):
             self._file_lister = shallow_file_list
         self.file_model.refresh()
 
+    def directory_loaded(self, directory):
+        # a deep listing also shows the contents of subdirectories
+        while directory is not None:
+            if directory is self._directory:
+                self.file_model.refresh()
+                return
+            if self._file_lister is not deep_file_list:
+                return
+            directory = directory.parent
+
     def toggle_filter(self, filter_func):
         def handler(include):
             if include:
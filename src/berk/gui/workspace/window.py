@@ -1,7 +1,7 @@
 import git_api
 
 from berk.model import Repo, WorkspaceDirectory, WorkTreeFile
-from berk.gui import busy_cursor, ViewToggler, Window
+from berk.gui import busy_cursor, run_in_background, ViewToggler, Window
 from berk.gui.workspace.directory_view import DirectoryView
 from berk.gui.workspace.file_view import FileView
 from berk.gui.workspace.open_repository import OpenRepositoryDialog
@@ -124,6 +124,7 @@ class WorkspaceWindow(Window):
                 repo = Repo(work_tree_dir=dialog.work_tree_dir,
                     git_dir=dialog.git_dir)
                 self.app.workspace.add_repo(repo)
+            self.validate_snapshot(repo)
 
     def create_repository(self):
         dir_path = QFileDialog.getExistingDirectory(self,
@@ -142,6 +143,17 @@ class WorkspaceWindow(Window):
                 else:
                     repo = Repo(work_tree_dir=dialog.repo_dir)
                 self.app.workspace.add_repo(repo)
+            self.validate_snapshot(repo)
+
+    def validate_snapshot(self, repo):
+        # a repo restored from its snapshot is shown right away, and patched
+        # once a fresh scan completes in the background. If the repo changes
+        # while the scan runs, the scan is dropped and another one started.
+        def scanned(scan):
+            if not repo.apply_scan(scan):
+                self.validate_snapshot(repo)
+        if repo.snapshot_restored:
+            run_in_background(repo.scan, scanned)
 
     @property
     def selection_repo(self):
@@ -193,14 +205,19 @@ class WorkspaceWindow(Window):
         repo = self.selection_repo
         dialog = CommitDialog(repo=repo, selected_items=self.selected_items,
             parent=self)
-        if dialog.exec_() == dialog.Rejected: return
-        with busy_cursor():
-            if dialog.use_staged_changes:
-                files = ()
-            else:
-                files = tuple(dialog.selected_local_changes)
-                to_add = filter(lambda f: f.index_status == git_api.UNTRACKED,
-                    files)
-                if to_add:
-                    repo.stage(to_add)
-            repo.commit(message=dialog.message, paths=files, amend=dialog.amend)
+        # deleted once done with, since it holds on to the repo's commit store
+        try:
+            if dialog.exec_() == dialog.Rejected: return
+            with busy_cursor():
+                if dialog.use_staged_changes:
+                    files = ()
+                else:
+                    files = tuple(dialog.selected_local_changes)
+                    to_add = filter(
+                        lambda f: f.index_status == git_api.UNTRACKED, files)
+                    if to_add:
+                        repo.stage(to_add)
+                repo.commit(message=dialog.message, paths=files,
+                    amend=dialog.amend)
+        finally:
+            dialog.deleteLater()
@@ -1,8 +1,12 @@
 import os.path
 import posixpath
+import re
+import bisect
+import operator
 
 import itertools
 import collections
+import contextlib
 
 import inspect
 
@@ -18,6 +22,18 @@ def reflect_repr(obj, *attrs):
 
 Unchanged = object()
 
+# How ignored items are shown in a repo's work tree
+IGNORED_NONE = 0       # not shown at all
+IGNORED_COLLAPSED = 1  # ignored directories are loaded only when requested
+IGNORED_FULL = 2       # everything is loaded up front
+
+# How a path relates to a repo's scopes
+_INSIDE_SCOPE = 1
+_LEADS_TO_SCOPE = 2
+
+_unmodified_status = dict(index_status=git_api.UNMODIFIED,
+    work_tree_status=git_api.UNMODIFIED)
+
 
 def split_path(path, module=os.path):
     head, tail = module.split(path)
@@ -36,21 +52,115 @@ def repo_path_to_os(path):
     return xformed
 
 
+def is_nested_repo(os_path):
+    # a nested repo's .git is either its git dir, or a gitfile pointing to it
+    # (as in submodules)
+    return os.path.exists(os.path.join(os_path, '.git'))
+
+
+def parent_paths(path):
+    # yields the repo paths of all the ancestors of path, up to the root ('')
+    while path:
+        path = posixpath.dirname(path)
+        yield path
+
+
+def glob_escape(path):
+    return re.sub(r'([*?[])', r'[\1]', path)
+
+
+def children_pathspec(path):
+    # matches the direct children of the directory at path, but not deeper
+    return ':(glob)%s*' % (glob_escape(path) + '/' if path else '')
+
+
+def normalize_scopes(scopes):
+    if not scopes: return None
+    scopes = set(posixpath.normpath(str(scope)).strip('/') for scope in scopes)
+    if '' in scopes or '.' in scopes: return None
+    return tuple(sorted(scope for scope in scopes
+        if not any(parent in scopes for parent in parent_paths(scope))))
+
+
+def covering_directories(items):
+    # Returns the smallest set of directory paths that contain all the given
+    # items, or an empty tuple if that's the whole repo
+    dirs = set()
+    for item in items:
+        if isinstance(item, WorkspaceDirectory):
+            dirs.add(item.path)
+        else:
+            dirs.add(posixpath.dirname(str(item)))
+    if '' in dirs:
+        return ()
+    return sorted(path for path in dirs
+        if not any(parent in dirs for parent in parent_paths(path)))
+
+
+def skip_entries(entries, pos, prefix):
+    while pos < len(entries) and entries[pos][0].startswith(prefix):
+        pos += 1
+    return pos
+
+
 class Workspace(object):
-    def __init__(self, git):
+    def __init__(self, git, cache=None):
         self.git = git
+        self.cache = cache
         self.repos = []
         self.before_repo_added = Event()
         self.repo_added = Event()
         self.before_repo_refreshed = Event()
         self.repo_refreshed = Event()
+        self.refs_refreshed = Event()
         self.item_updated = Event()
-
+        self.items_updated = Event()
+        self.before_directory_loaded = Event()
+        self.directory_loaded = Event()
+        self._updated_items = None
+        self._added_repos = None
+
+    # Repos added while another one is being added, such as the nested repos
+    # found by its first scan, are queued and added once it's done, so that
+    # before_repo_added and repo_added always come in pairs.
     def add_repo(self, repo):
-        self.before_repo_added()
-        self.repos.append(repo)
-        repo.added_to_workspace(self)
-        self.repo_added()
+        if self._added_repos is not None:
+            self._added_repos.append(repo)
+            return
+        self._added_repos = [repo]
+        try:
+            while self._added_repos:
+                repo = self._added_repos.pop(0)
+                self.before_repo_added()
+                self.repos.append(repo)
+                repo.added_to_workspace(self)
+                self.repo_added()
+        finally:
+            self._added_repos = None
+
+    # Within this context, item updates are collected and reported with a
+    # single items_updated event when the outermost context exits. Outside of
+    # it, every update fires both item_updated and items_updated.
+    @contextlib.contextmanager
+    def updating_items(self):
+        if self._updated_items is not None:
+            yield
+            return
+        self._updated_items = []
+        try:
+            yield
+        finally:
+            items = self._updated_items
+            self._updated_items = None
+            if items:
+                self.items_updated(items)
+
+    def notify_item_updated(self, item):
+        if self._updated_items is not None:
+            self._updated_items.append(item)
+        else:
+            self.item_updated(item)
+            self.items_updated([item])
 
 
 class WorkspaceItem(object):
@@ -73,6 +183,20 @@ class WorkspaceDirectory(WorkspaceItem):
     def __init__(self, repo, path, os_path):
         super(WorkspaceDirectory, self).__init__(repo, path, os_path)
         self.set_children(dirs=(), files=())
+        # An unloaded directory has no children until Repo.load_directory is
+        # called for it. Until then, content_status is the status its contents
+        # would inherit.
+        self.loaded = True
+        self.content_status = None
+        # The work tree of a nested repo or submodule, which is never walked.
+        # If the repo registers nested repos, nested_repo is the Repo for it.
+        self.nested = False
+        self.nested_repo = None
+
+    def unload(self, content_status):
+        self.set_children(dirs=(), files=())
+        self.loaded = False
+        self.content_status = content_status
 
     def resolve(self, path):
         # use normpath to strip trailing slash (e.g. 'bin/')
@@ -145,15 +269,100 @@ def wrap_git_methods(cls):
             setattr(cls, member_name, wrap_git_method(member)(pass_through(member)))
     return cls
 
+def _pack_directory(directory):
+    return (
+        tuple((d.name, None if d.nested else
+                _pack_directory(d) if d.loaded else d.content_status)
+            for d in directory.dirs),
+        tuple((f.name, f.index_status, f.work_tree_status, f.old_path)
+            for f in directory.files))
+
+def _unpack_directory(repo, directory, packed, nested):
+    packed_dirs, packed_files = packed
+    dirs = []
+    for name, packed_dir in packed_dirs:
+        child = WorkspaceDirectory(repo, posixpath.join(directory.path, name),
+            os.path.join(directory.os_path, name))
+        if packed_dir is None:
+            child.nested = True
+            nested.append(child)
+            dirs.append(child)
+        elif isinstance(packed_dir, dict):
+            child.unload(packed_dir)
+            dirs.append(child)
+        else:
+            dirs.append(_unpack_directory(repo, child, packed_dir, nested))
+    files = [WorkTreeFile(repo, posixpath.join(directory.path, name),
+            os.path.join(directory.os_path, name), index_status,
+            work_tree_status, old_path)
+        for name, index_status, work_tree_status, old_path in packed_files]
+    directory.set_children(dirs=dirs, files=files)
+    return directory
+
+
+# Result of Repo.scan(). The scan doesn't touch the repo's items, so it can run
+# on a background thread, and then be applied to the repo with apply_scan().
+# generation is the repo's scan_generation when the scan started.
+RepoScan = collections.namedtuple('RepoScan',
+    ('root', 'branches', 'head_id', 'head_ref', 'fingerprint', 'nested',
+    'generation'))
+
+
 @wrap_git_methods
 class Repo(WorkspaceDirectory):
-    def __init__(self, work_tree_dir, git_dir=None):
+    snapshot_namespace = 'work-tree'
+
+    # Changes to ignored_mode, untracked_mode and the status accelerations
+    # (untracked_cache, fsmonitor, preload_index and index_threads, see
+    # git_api.Git.status) take effect on the next refresh. With
+    # UNTRACKED_NORMAL, untracked directories are loaded only when requested.
+    # With UNTRACKED_NO, the tree is built from the index, and the work tree
+    # isn't walked at all.
+    #
+    # If scopes are given, status, log, diff summary and the work tree are
+    # limited to those directories, and everything else is left unloaded. Use
+    # set_scopes() to change them.
+    #
+    # Nested repos and submodules found in the work tree aren't walked. With
+    # register_nested, each of them is added to the workspace as a lazy Repo,
+    # which is only scanned once its root gets loaded.
+    #
+    # commit_graph is whether path-limited logs may keep git's commit-graph
+    # file in the repo up to date (see CommitStore.update_commit_graph). None
+    # leaves it to the repo's core.commitGraph, which git defaults to true.
+    def __init__(self, work_tree_dir, git_dir=None,
+            ignored_mode=IGNORED_COLLAPSED, untracked_mode=git_api.UNTRACKED_ALL,
+            untracked_cache=None, fsmonitor=None, preload_index=None,
+            index_threads=None, scopes=None, register_nested=False,
+            lazy=False, commit_graph=None):
         assert work_tree_dir or git_dir
         self._workspace = None
         super(Repo, self).__init__(repo=self, path='',
             os_path=work_tree_dir or git_dir)
         self.work_tree_dir = work_tree_dir
         self.git_dir = git_dir
+        self.ignored_mode = ignored_mode
+        self.untracked_mode = untracked_mode
+        self.untracked_cache = untracked_cache
+        self.fsmonitor = fsmonitor
+        self.preload_index = preload_index
+        self.index_threads = index_threads
+        self.scopes = normalize_scopes(scopes)
+        self.register_nested = register_nested
+        self.lazy = lazy
+        self.commit_graph = commit_graph
+        self.snapshot_restored = False
+        # the fingerprint of the snapshot last stored or restored
+        self._snapshot_fingerprint = None
+        # bumped whenever the items change, see apply_scan()
+        self.scan_generation = 0
+        self.parent_repo = None
+        self.nested_repos = {}
+        self.branches = []
+        self.head_id = None
+        self.head_ref = None
+        # maps commit ids to the refs pointing at them, see read_ref_map()
+        self.ref_map = None
 
     def __repr__(self):
         return reflect_repr(self, 'work_tree_dir', 'git_dir')
@@ -175,104 +384,458 @@ class Repo(WorkspaceDirectory):
         if not self.git_dir:
             self.git_dir = self.git.get_properties(self.work_tree_dir,
                 git_dir=True)[0]
-        self.refresh()
+        if self.lazy and self.work_tree_dir:
+            self.unload(_unmodified_status)
+        elif not self.restore_snapshot():
+            self.refresh()
 
     def refresh(self):
-        self.workspace.before_repo_refreshed(self)
+        self.apply_scan(self.scan())
+
+    def scan(self):
+        generation = self.scan_generation
+        head_id, head_ref = self._head()
+        nested = []
         if self.work_tree_dir:
-            self._populate_work_tree()
+            root = self._populate_work_tree(nested)
         else:
-            self.set_children(dirs=(), files=())
-        self.branches = [ref[len('refs/heads/'):] for ref in
+            root = None
+        branches = [ref[len('refs/heads/'):] for ref in
             self.git.refs(self.work_tree_dir, self.git_dir, branches=True)]
+        # git status may rewrite the index, so stamp it after populating
+        fingerprint = (head_id, head_ref, self._index_stamp(),
+            self._scan_settings())
+        return RepoScan(root, branches, head_id, head_ref, fingerprint,
+            nested, generation)
+
+    # A scan that started before the items last changed, such as by staging
+    # files while it ran, may have missed the change, so it's dropped.
+    # Returns whether it was applied.
+    def apply_scan(self, scan):
+        if scan.generation != self.scan_generation: return False
+        self.snapshot_restored = False
+        self._apply_scan(scan)
+        self._save_snapshot(scan)
+        return True
+
+    def _apply_scan(self, scan):
+        self.scan_generation += 1
+        self.workspace.before_repo_refreshed(self)
+        if scan.root:
+            self.set_children(dirs=scan.root.dirs, files=scan.root.files)
+        else:
+            self.set_children(dirs=(), files=())
+        self.loaded = True
+        self.content_status = None
+        self.branches = scan.branches
+        self.head_id = scan.head_id
+        self.head_ref = scan.head_ref
+        self.workspace.repo_refreshed(self)
+        self._register_nested(scan.nested)
+
+    def _register_nested(self, nested_dirs):
+        if not self.register_nested: return
+        for directory in nested_dirs:
+            nested_repo = self.nested_repos.get(directory.path)
+            if nested_repo is None:
+                nested_repo = Repo(work_tree_dir=directory.os_path,
+                    ignored_mode=self.ignored_mode,
+                    untracked_mode=self.untracked_mode,
+                    untracked_cache=self.untracked_cache,
+                    fsmonitor=self.fsmonitor, preload_index=self.preload_index,
+                    index_threads=self.index_threads, register_nested=True,
+                    lazy=True, commit_graph=self.commit_graph)
+                nested_repo.parent_repo = self
+                self.nested_repos[directory.path] = nested_repo
+                self.workspace.add_repo(nested_repo)
+            directory.nested_repo = nested_repo
+
+    def _head(self):
         try:
-            self.head_id, self.head_ref = self.git.head(self.work_tree_dir,
-                self.git_dir)
+            head_id, head_ref = self.git.head(self.work_tree_dir, self.git_dir)
         except git_api.GitCommandError:
-            self.head_id = None
-            self.head_ref = None
-        if self.head_ref: self.head_ref = self.head_ref[len('refs/heads/'):]
-        self.workspace.repo_refreshed(self)
+            return None, None
+        if head_ref: head_ref = head_ref[len('refs/heads/'):]
+        return head_id, head_ref
+
+    # Refs are read on their own rather than decorating every commit of a
+    # log, each as a (name, type) pair from git_api.parse_ref, in refname
+    # order. A detached HEAD comes first as ('HEAD', REF_OTHER). Otherwise,
+    # symbolic refs such as origin/HEAD are left out, but the commits they
+    # point at are still in the map, as every ref's commit is.
+    def read_ref_map(self):
+        head_id, head_ref = self._head()
+        ref_map = collections.defaultdict(list)
+        for ref, commit_id in self.git.ref_tips(self.work_tree_dir,
+                self.git_dir):
+            refs = ref_map[commit_id]
+            if head_ref and posixpath.basename(ref) == 'HEAD':
+                continue
+            refs.append(git_api.parse_ref(ref))
+        if head_id and not head_ref:
+            ref_map[head_id].insert(0, ('HEAD', git_api.REF_OTHER))
+        return dict((commit_id, tuple(refs))
+            for commit_id, refs in ref_map.iteritems())
 
-    log = git_api.Git.log
-    diff_summary = git_api.Git.diff_summary
-    status = git_api.Git.status
+    def apply_ref_map(self, ref_map):
+        if ref_map == self.ref_map: return
+        self.ref_map = ref_map
+        self.workspace.refs_refreshed(self)
+
+    def _scan_settings(self):
+        return self.ignored_mode, self.untracked_mode, self.scopes
+
+    def _index_stamp(self):
+        try:
+            stat = os.stat(os.path.join(self.git_dir, 'index'))
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def restore_snapshot(self):
+        cache = self.workspace.cache
+        if not (cache and self.work_tree_dir): return False
+        head_id, head_ref = self._head()
+        fingerprint = (head_id, head_ref, self._index_stamp(),
+            self._scan_settings())
+        snapshot = cache.load(self.snapshot_namespace, self.git_dir,
+            fingerprint)
+        if snapshot is None: return False
+        packed_root, branches = snapshot
+        nested = []
+        root = _unpack_directory(self,
+            WorkspaceDirectory(self, '', self.work_tree_dir), packed_root,
+            nested)
+        # the snapshot is shown until a fresh scan gets applied, and it's up
+        # to the caller to schedule one
+        self.snapshot_restored = True
+        self._snapshot_fingerprint = fingerprint
+        self._apply_scan(RepoScan(root, branches, head_id, head_ref,
+            fingerprint, nested, self.scan_generation))
+        return True
+
+    def _save_snapshot(self, scan):
+        cache = self.workspace.cache
+        if not (cache and scan.root): return
+        # pickling the whole tree isn't worth it unless the snapshot stored
+        # has gone stale
+        if scan.fingerprint == self._snapshot_fingerprint: return
+        cache.store(self.snapshot_namespace, self.git_dir,
+            (_pack_directory(scan.root), scan.branches), scan.fingerprint)
+        self._snapshot_fingerprint = scan.fingerprint
+
+    @wrap_git_method(git_api.Git.log)
+    def log(self, paths, **kwargs):
+        return self.git.log(paths=paths or self.scopes or (), **kwargs)
+
+    @wrap_git_method(git_api.Git.rev_list)
+    def rev_list(self, paths, **kwargs):
+        return self.git.rev_list(paths=paths or self.scopes or (), **kwargs)
+
+    @wrap_git_method(git_api.Git.diff_summary)
+    def diff_summary(self, paths, **kwargs):
+        return self.git.diff_summary(paths=paths or self.scopes or (), **kwargs)
+
+    def status(self, paths=()):
+        if self.untracked_mode == git_api.UNTRACKED_NO:
+            # git doesn't report ignored files without untracked ones
+            ignored = None
+        elif self.untracked_mode == git_api.UNTRACKED_ALL and \
+                self.ignored_mode != IGNORED_FULL:
+            # with -uall, traditional mode would list every ignored file
+            ignored = 'matching'
+        else:
+            ignored = 'traditional'
+        return self.git.status(self.work_tree_dir, self.git_dir,
+            paths=paths or self._scope_pathspecs(), ignored=ignored,
+            untracked=self.untracked_mode,
+            untracked_cache=self.untracked_cache, fsmonitor=self.fsmonitor,
+            preload_index=self.preload_index,
+            index_threads=self.index_threads)
+
+    # The follow-up status is scoped to the staged paths, or for selections
+    # of more than status_path_limit items, to the directories containing
+    # them, which keeps its command line short
+    status_path_limit = 100
+
+    def _status_paths(self, items):
+        items = list(items)
+        if len(items) > self.status_path_limit:
+            return covering_directories(items)
+        paths = [str(item) for item in items]
+        return () if '' in paths else paths
 
     @wrap_git_method(git_api.Git.stage)
     def stage(self, paths, **kwargs):
         self.git.stage(paths=paths, **kwargs)
-        self._update_statuses(self.status(paths=paths))
+        self._update_statuses(self.status(paths=self._status_paths(paths)))
 
     @wrap_git_method(git_api.Git.unstage)
     def unstage(self, paths, **kwargs):
         self.git.unstage(paths=paths, **kwargs)
-        self._update_statuses(self.status(paths=paths))
+        self._update_statuses(self.status(paths=self._status_paths(paths)))
 
     @wrap_git_method(git_api.Git.commit)
     def commit(self, **kwargs):
         self.git.commit(**kwargs)
         self.refresh()
 
-    def _populate_work_tree(self):
-        status_map = {}
-        deleted_map = collections.defaultdict(list)
-        status_iter = self.status()
-        for path, index_status, work_tree_status, old_path in status_iter:
-            # use normpath on the key to strip trailing slash (e.g. 'bin/')
-            status_map[posixpath.normpath(path)] = dict(
-                index_status=index_status, work_tree_status=work_tree_status,
-                old_path=old_path)
-            os_path = os.path.join(self.work_tree_dir, repo_path_to_os(path))
-            if not os.path.exists(os_path):
-                deleted_map[posixpath.dirname(path)].append(path)
-
-        def populate_directory(directory, parent_status):
-            dirs = []
-            files = []
-            for filename in os.listdir(directory.os_path):
-                if directory.path == '' and filename == '.git':
+    def load_directory(self, directory):
+        if directory.loaded: return
+        if directory is self:
+            # a lazy repo's root
+            self.refresh()
+            return
+        self.scan_generation += 1
+        nested = []
+        scanned = self._scan_directory(directory, (directory.path,),
+            recursive=False, nested=nested)
+        self.workspace.before_directory_loaded(directory, scanned.dirs,
+            scanned.files)
+        directory.set_children(dirs=scanned.dirs, files=scanned.files)
+        directory.loaded = True
+        directory.content_status = None
+        self.workspace.directory_loaded(directory)
+        self._register_nested(nested)
+
+    def set_scopes(self, scopes):
+        scopes = normalize_scopes(scopes)
+        old_scopes = self.scopes
+        if scopes == old_scopes: return
+        self.scopes = scopes
+        if scopes is None:
+            self.refresh()
+            return
+        self.scan_generation += 1
+        # only the newly added scopes need to be scanned; whatever fell out
+        # of scope is simply unloaded
+        added_scopes = [scope for scope in scopes if not (old_scopes is None or
+            any(old_scope in parent_paths(scope) or old_scope == scope
+                for old_scope in old_scopes))]
+        self.workspace.before_repo_refreshed(self)
+        self._unload_out_of_scope(self)
+        for scope in added_scopes:
+            self._load_scope(scope)
+        self.workspace.repo_refreshed(self)
+
+    def _scope_relation(self, path):
+        if not self.scopes:
+            return _INSIDE_SCOPE
+        result = None
+        for scope in self.scopes:
+            if path == scope or scope in parent_paths(path):
+                return _INSIDE_SCOPE
+            if path in parent_paths(scope):
+                result = _LEADS_TO_SCOPE
+        return result
+
+    def _scope_pathspecs(self):
+        if not self.scopes: return ()
+        # directories leading to the scopes are included without their
+        # subdirectories, so that their files get a status too
+        ancestors = set(parent for scope in self.scopes
+            for parent in parent_paths(scope))
+        return list(self.scopes) + [children_pathspec(path)
+            for path in sorted(ancestors)]
+
+    def _unload_out_of_scope(self, directory):
+        for child in directory.dirs:
+            if not child.loaded: continue
+            relation = self._scope_relation(child.path)
+            if relation is None:
+                child.unload(_unmodified_status)
+            elif relation == _LEADS_TO_SCOPE:
+                self._unload_out_of_scope(child)
+
+    def _load_scope(self, scope):
+        # find the first unloaded directory on the way to the scope, and scan
+        # it together with the files of the directories leading to the scope
+        target = self
+        for name in split_path(scope, posixpath):
+            if not target.loaded: break
+            child = target.path_map.get(name)
+            if not isinstance(child, WorkspaceDirectory): return
+            target = child
+        pathspecs = [scope] + [children_pathspec(path)
+            for path in parent_paths(scope)
+            if path == target.path or target.path in parent_paths(path)]
+        nested = []
+        scanned = self._scan_directory(target, pathspecs, nested=nested)
+        target.set_children(dirs=scanned.dirs, files=scanned.files)
+        target.loaded = True
+        target.content_status = None
+        self._register_nested(nested)
+
+    def _scan_directory(self, directory, pathspecs, recursive=True,
+            nested=None):
+        scanned = WorkspaceDirectory(self, directory.path, directory.os_path)
+        if self.untracked_mode == git_api.UNTRACKED_NO:
+            return self._populate_from_index(scanned, pathspecs)
+        entries = self._status_entries(self.status(paths=pathspecs))
+        key = directory.path + '/'
+        pos = bisect.bisect_left(entries, (key,))
+        if pos < len(entries) and entries[pos][0] == key:
+            parent_status = entries[pos][1]
+            pos += 1
+        else:
+            parent_status = directory.content_status or _unmodified_status
+        self._merge_directory(scanned, parent_status, entries, pos,
+            recursive=recursive, nested=nested)
+        return scanned
+
+    def _populate_work_tree(self, nested=None):
+        root = WorkspaceDirectory(self, '', self.work_tree_dir)
+        if self.untracked_mode == git_api.UNTRACKED_NO:
+            return self._populate_from_index(root)
+        self._merge_directory(root, _unmodified_status,
+            self._status_entries(self.status()), 0, nested=nested)
+        return root
+
+    def _populate_from_index(self, directory, pathspecs=()):
+        entries = self._status_entries(self.status(paths=pathspecs))
+        directory.set_children(dirs=[], files=[])
+        dir_map = {directory.path: directory}
+        def get_dir(path):
+            if path in dir_map:
+                return dir_map[path]
+            parent = get_dir(posixpath.dirname(path))
+            new_dir = WorkspaceDirectory(self, path,
+                os.path.join(parent.os_path, posixpath.basename(path)))
+            new_dir.set_children(dirs=[], files=[])
+            parent.add_children(new_dir)
+            dir_map[path] = new_dir
+            return new_dir
+        # the index is sorted in git path order too, so the status entries
+        # are matched up with it in a single pass
+        pos = 0
+        for path in self.git.tracked_files(self.work_tree_dir, self.git_dir,
+                paths=pathspecs or self._scope_pathspecs()):
+            while pos < len(entries) and entries[pos][0] < path:
+                pos += 1
+            if pos < len(entries) and entries[pos][0] == path:
+                file_status = entries[pos][1]
+                pos += 1
+            else:
+                file_status = _unmodified_status
+            parent = get_dir(posixpath.dirname(path))
+            parent.add_children(WorkTreeFile(self, path,
+                os.path.join(parent.os_path, posixpath.basename(path)),
+                **file_status))
+        # directories leading to the scopes also show the directories outside
+        # of them, as unloaded placeholders
+        for path, parent in dir_map.items():
+            if self._scope_relation(path) != _LEADS_TO_SCOPE or \
+                    not os.path.isdir(parent.os_path):
+                continue
+            for name in os.listdir(parent.os_path):
+                child_path = posixpath.join(path, name)
+                child_os_path = os.path.join(parent.os_path, name)
+                if name in parent.path_map or child_path == '.git' or \
+                        not os.path.isdir(child_os_path):
                     continue
-                file_path = posixpath.join(directory.path, filename)
-                file_os_path = os.path.join(directory.os_path, filename)
-                file_status = status_map.get(file_path, parent_status)
-                if os.path.isdir(file_os_path):
-                    dirs.append(populate_directory(
-                        WorkspaceDirectory(self, file_path, file_os_path),
-                        file_status))
-                else:
-                    files.append(WorkTreeFile(self, file_path,
-                        file_os_path, **file_status))
-            directory.set_children(dirs=dirs, files=files)
-            return directory
-
-        unmodified = dict(index_status=git_api.UNMODIFIED, 
-            work_tree_status=git_api.UNMODIFIED)
-        populate_directory(self, unmodified)
-
-        def find_or_create_dir(path):
-            result = self
-            for name in split_path(path, posixpath):
-                if name in result.path_map:
-                    result = result.path_map[name]
+                placeholder = WorkspaceDirectory(self, child_path,
+                    child_os_path)
+                placeholder.unload(_unmodified_status)
+                parent.add_children(placeholder)
+        return directory
+
+    def _status_entries(self, status_iter):
+        # git reports directories with a trailing slash, which is also how
+        # they're keyed in the walk, so both sort in git path order. Each
+        # group of the status output is already sorted, which makes the sort
+        # close to linear.
+        entries = [(path, dict(index_status=index_status,
+                work_tree_status=work_tree_status, old_path=old_path))
+            for path, index_status, work_tree_status, old_path in status_iter]
+        entries.sort(key=operator.itemgetter(0))
+        return entries
+
+    def _merge_directory(self, directory, parent_status, entries, pos,
+            recursive=True, on_disk=True, nested=None):
+        # walks the directory in git path order alongside the sorted status
+        # entries, starting at pos, and returns the position of the first
+        # entry outside of the directory. Entries which don't meet a child on
+        # the disk are items git knows about that have been deleted.
+        prefix = directory.path + '/' if directory.path else ''
+        children = []
+        if on_disk:
+            try:
+                names = os.listdir(directory.os_path)
+            except OSError:
+                names = []
+            for name in names:
+                if not prefix and name == '.git':
+                    continue
+                is_dir = os.path.isdir(os.path.join(directory.os_path, name))
+                children.append((name + '/' if is_dir else name, name, is_dir))
+            children.sort()
+        dir_names = set(name for key, name, is_dir in children if is_dir)
+        # statuses of directories reported without a trailing slash, such as
+        # submodules and symbolic links
+        dir_statuses = {}
+        dirs = []
+        files = []
+
+        def add_child(name, is_dir, file_status, pos, on_disk=True):
+            file_path = prefix + name
+            file_os_path = os.path.join(directory.os_path, name)
+            ignored = (file_status['index_status'] == git_api.IGNORED)
+            if ignored and self.ignored_mode == IGNORED_NONE:
+                return skip_entries(entries, pos, file_path + '/') \
+                    if is_dir else pos
+            if is_dir:
+                child = WorkspaceDirectory(self, file_path, file_os_path)
+                untracked = (file_status['index_status'] == git_api.UNTRACKED)
+                if on_disk and is_nested_repo(file_os_path):
+                    # git doesn't descend into nested repos either, so at most
+                    # their own entry was reported
+                    pos = skip_entries(entries, pos, file_path + '/')
+                    child.nested = True
+                    if nested is not None:
+                        nested.append(child)
+                elif not recursive or (ignored and
+                        self.ignored_mode == IGNORED_COLLAPSED) or (untracked
+                        and self.untracked_mode == git_api.UNTRACKED_NORMAL) or \
+                        self._scope_relation(file_path) is None:
+                    pos = skip_entries(entries, pos, file_path + '/')
+                    child.unload(file_status)
                 else:
-                    new_dir = WorkspaceDirectory(self,
-                        posixpath.join(result.path, name),
-                        os.path.join(result.os_path, name))
-                    new_dir.set_children([], [])
-                    result.add_children(new_dir)
-                    result = new_dir
-            return result
-
-        for deleted_path, deleted_files in deleted_map.iteritems():
-            parent_dir = find_or_create_dir(deleted_path)
-            for deleted_file in deleted_files:
-                filename = posixpath.basename(deleted_file)
-                file_obj = WorkTreeFile(self, deleted_file,
-                    os.path.join(parent_dir.os_path, filename),
-                    **status_map[deleted_file])
-                parent_dir.add_children(file_obj)
-
-        return
+                    pos = self._merge_directory(child, file_status, entries,
+                        pos, on_disk=on_disk, nested=nested)
+                dirs.append(child)
+            else:
+                files.append(WorkTreeFile(self, file_path, file_os_path,
+                    **file_status))
+            return pos
+
+        def add_missing(pos):
+            path, file_status = entries[pos]
+            rest = path[len(prefix):]
+            name, slash, _ = rest.partition('/')
+            if not slash:
+                if name in dir_names:
+                    dir_statuses[name] = file_status
+                    return pos + 1
+                return add_child(name, False, file_status, pos + 1)
+            # a deleted directory, which holds this entry and any that follow
+            # it with the same prefix
+            return add_child(name, True, parent_status, pos, on_disk=False)
+
+        for key, name, is_dir in children:
+            full_key = prefix + key
+            while pos < len(entries) and entries[pos][0] < full_key and \
+                    not entries[pos][0].startswith(full_key):
+                pos = add_missing(pos)
+            if pos < len(entries) and entries[pos][0] == full_key:
+                file_status = entries[pos][1]
+                pos += 1
+            else:
+                file_status = dir_statuses.get(name, parent_status)
+            pos = add_child(name, is_dir, file_status, pos)
+        while pos < len(entries) and entries[pos][0].startswith(prefix):
+            pos = add_missing(pos)
+        directory.set_children(dirs=dirs, files=files)
+        return pos
 
     def _update_item_status(self, item, index_status, work_tree_status,
             old_path):
@@ -285,9 +848,16 @@ class Repo(WorkspaceDirectory):
                 old_path)
 
     def _update_statuses(self, status_iter):
-        for path, index_status, work_tree_status, old_path in status_iter:
-            self._update_item_status(self.resolve(path), index_status,
-                work_tree_status, old_path)
+        self.scan_generation += 1
+        with self.workspace.updating_items():
+            for path, index_status, work_tree_status, old_path in status_iter:
+                try:
+                    item = self.resolve(path)
+                except KeyError:
+                    # not loaded yet, it will get its status when it is
+                    continue
+                self._update_item_status(item, index_status,
+                    work_tree_status, old_path)
 
 
 class WorkTreeFile(WorkspaceItem):
@@ -310,7 +880,7 @@ class WorkTreeFile(WorkspaceItem):
             self.work_tree_status = work_tree_status
         if old_path is not Unchanged:
             self.old_path = old_path
-        self.workspace.item_updated(self)
+        self.workspace.notify_item_updated(self)
 
     @property
     def our_merge_status(self):
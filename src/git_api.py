@@ -2,6 +2,7 @@ from __future__ import print_function
 
 import subprocess
 import os.path
+import tempfile
 import re
 import collections
 import dateutil.parser
@@ -18,6 +19,11 @@ UNTRACKED = -1
 IGNORED = -2
 MISSING_PATH = -3
 
+# Untracked file modes for status
+UNTRACKED_NO = 'no'
+UNTRACKED_NORMAL = 'normal'
+UNTRACKED_ALL = 'all'
+
 _status_char_map = {
     ' ' : UNMODIFIED,
     'M' : MODIFIED,
@@ -66,7 +72,15 @@ class GitExe(object):
     def __getattr__(self, name):
         def create_command(*args, **kwargs):
             cmd_name = name.replace('_', '-')
-            cmd_args = [self._executable, cmd_name]
+            cmd_args = [self._executable]
+            # _config holds configuration overrides, passed to git with -c
+            config = kwargs.pop('_config', None) or {}
+            for key, value in sorted(config.iteritems()):
+                if value is None: continue
+                if isinstance(value, bool):
+                    value = 'true' if value else 'false'
+                cmd_args.extend(('-c', '%s=%s' % (key, value)))
+            cmd_args.append(cmd_name)
             cmd_options = {}
             for k, v in kwargs.iteritems():
                 # if a kwarg starts with _, it's a command object option
@@ -122,8 +136,11 @@ class GitCommandError(Exception):
 
 Default = object()
 class GitCommand(object):
+    # With separate_stderr, stderr is kept out of stdout, so that output can
+    # be parsed as it's read, and only shows up in the GitCommandError raised
+    # by check().
     def __init__(self, args, cwd=None, env=None, ok_codes=(0,), readonly=False,
-            no_io=False, flush_print=True):
+            no_io=False, flush_print=True, separate_stderr=False):
         # Uncomment to debug:
         # print(' '.join(args))
         self.args = args
@@ -140,13 +157,15 @@ class GitCommand(object):
         self._stdin_fd = None if (no_io or readonly) else subprocess.PIPE
         self._stdout_fd = None if no_io else subprocess.PIPE
         self.flush_print = flush_print
+        self.separate_stderr = separate_stderr
+        self._stderr_file = None
         self.process = None
         self.output = ''
 
     def clone(self):
         return GitCommand(self.args, cwd=self.cwd, env=self.env,
             ok_codes=self.ok_codes, readonly=self.readonly, no_io=self._no_io,
-            flush_print=self.flush_print)
+            flush_print=self.flush_print, separate_stderr=self.separate_stderr)
 
     def popen(self, stdin=Default, stdout=Default):
         if stdin is Default:
@@ -165,9 +184,15 @@ class GitCommand(object):
             startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
         else:
             startupinfo = None
+        if self.separate_stderr:
+            # a file rather than a pipe, which could fill up while stdout is
+            # being read
+            self._stderr_file = stderr = tempfile.TemporaryFile()
+        else:
+            stderr = subprocess.STDOUT
         self.process = subprocess.Popen(args=self.args, cwd=self.cwd, env=env,
             startupinfo=startupinfo, stdin=stdin, stdout=stdout, 
-            stderr=subprocess.STDOUT)
+            stderr=stderr)
         return self.process
 
     @property
@@ -192,17 +217,24 @@ class GitCommand(object):
             self.popen().wait()
         return self
 
-    def check(self, chomp=True):
+    def check(self, chomp=True, input=None):
         if chomp:
-            self.output += self.popen().communicate()[0]
+            self.output += self.popen().communicate(input)[0]
         else:
-            self.wait()
+            self.wait(chomp=False)
         if not self:
             if not chomp:
                 self.output += self.popen().communicate()[0]
-            raise rc_exception_class(self)(self.output)
+            raise rc_exception_class(self)(self.output + self.errors)
         return self
 
+    @property
+    def errors(self):
+        if self._stderr_file is None:
+            return ''
+        self._stderr_file.seek(0)
+        return self._stderr_file.read()
+
     @property
     def stdin(self):
         return self.popen().stdin
@@ -230,7 +262,7 @@ class GitCommand(object):
 StatusEntry = collections.namedtuple('StatusEntry', 
     ('path', 'index_status', 'work_tree_status', 'old_path'))
 LogEntry = collections.namedtuple('LogEntry', 
-    ('commit_id', 'refs', 'parent_ids',
+    ('commit_id', 'parent_ids',
         'author_name', 'author_email', 'author_date',
         'committer_name', 'committer_email', 'committer_date', 
         'message'))
@@ -262,8 +294,6 @@ def _parse_log_file(log_file):
         else:
             line = line[1:]
         commit_id = line
-        line = nextline().strip('\n ()')
-        refs = tuple(line.split(', ')) if line else ()
         line = nextline().rstrip()
         parent_ids = tuple(line.split(' ')) if line else ()
         author_name = nextline().rstrip()
@@ -278,10 +308,54 @@ def _parse_log_file(log_file):
             message.append(line[1:])
             line = nextline().rstrip('\n')
         message = tuple(message)
-        yield LogEntry(commit_id, refs, parent_ids, author_name, author_email, 
+        yield LogEntry(commit_id, parent_ids, author_name, author_email, 
             author_date, commiter_name, commiter_email, commiter_date, message)
 
-LOG_FMT = r'#%H%n%d%n%P%n%aN%n%aE%n%ai%n%cN%n%cE%n%ci%n%w(0,1,1)%B%n%w(0,0,0).'
+LOG_FMT = r'#%H%n%P%n%aN%n%aE%n%ai%n%cN%n%cE%n%ci%n%w(0,1,1)%B%n%w(0,0,0).'
+# only reads the subject line, which becomes the whole message
+LOG_SUBJECT_FMT = LOG_FMT.replace('%B', '%s')
+
+
+def parse_commit_message(commit_object):
+    # the message of a raw commit object, split as git log's would be
+    message = commit_object.partition('\n\n')[2]
+    return tuple(message.split('\n')) if message else ()
+
+
+# A git cat-file --batch process that's kept running, to read objects on
+# request without starting git every time.
+#
+# Ids are written a chunk at a time, and the objects of a chunk read before
+# the next one is written. Chunks are small enough to fit in a pipe's buffer
+# (4 KB on some systems), so that writing one never waits on git, while git
+# may be waiting for its output to be read.
+class CatFile(object):
+    chunk_size = 64
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+
+    def read(self, object_ids):
+        # yields (object_id, object_type, data), with None as the type and
+        # data of missing objects
+        object_ids = list(object_ids)
+        for start in xrange(0, len(object_ids), self.chunk_size):
+            chunk = object_ids[start:start + self.chunk_size]
+            self.cmd.stdin.write(''.join(object_id + '\n'
+                for object_id in chunk))
+            self.cmd.stdin.flush()
+            for object_id in chunk:
+                header = self.cmd.stdout.readline().split()
+                if len(header) != 3:
+                    yield object_id, None, None
+                    continue
+                data = self.cmd.read(int(header[2]))
+                self.cmd.read(1)
+                yield object_id, header[1], data
+
+    def close(self):
+        self.cmd.stdin.close()
+        self.cmd.wait(chomp=False)
 
 
 DIFF_SUMMARY_REGEX = re.compile(r'([^\t]+)\t([^\t]+)\t(.*)')
@@ -306,6 +380,23 @@ def _parse_diff_summary(output):
             deleted = None
         yield DiffSummaryEntry(path, added, deleted, new_path)
 
+def _parse_build_options(output):
+    version = None
+    features = set()
+    for line in output.splitlines():
+        if line.startswith('git version '):
+            version = tuple(int(part) for part in re.findall(r'\d+',
+                line[len('git version '):])[:3])
+        elif line.startswith('feature: '):
+            features.add(line[len('feature: '):].strip())
+    return version, frozenset(features)
+
+
+def _pathspecs(paths):
+    # the repo root has an empty path, which git doesn't accept as a pathspec
+    return [str(path) or '.' for path in (paths or ('.',))]
+
+
 REF_BRANCH = 0
 REF_REMOTE = 1
 REF_TAG = 2
@@ -326,6 +417,20 @@ def parse_ref(ref):
 class Git(object):
     def __init__(self, exe_name = 'git'):
         self.exe = GitExe(exe_name)
+        self._build_options = None
+
+    def build_options(self):
+        # (version, features) of the git executable, probed once
+        if self._build_options is None:
+            try:
+                output = self.exe.version(build_options=True).check().output
+            except GitCommandError:
+                output = ''
+            self._build_options = _parse_build_options(output)
+        return self._build_options
+
+    def has_feature(self, feature):
+        return feature in self.build_options()[1]
 
     def get_properties(self, path, git_dir=False, work_tree_dir=False,
             bare=False):
@@ -393,11 +498,60 @@ class Git(object):
             ref = None
         return commit_id, ref
 
-    def status(self, work_tree_dir, git_dir=None, paths=()):
-        cmd = self.exe.status('-z', '--ignored', '--', paths,
+    # Every ref with the commit it points to, tags being peeled
+    def ref_tips(self, work_tree_dir, git_dir=None):
+        cmd = self.exe.for_each_ref(
+            format='%(refname) %(objectname) %(*objectname)',
+            **self._repo_opts(work_tree_dir, git_dir))
+        tips = []
+        for line in cmd.check().output.splitlines():
+            ref, object_id, peeled_id = line.split(' ')
+            tips.append((ref, peeled_id or object_id))
+        return tuple(tips)
+
+    # The value of a configuration variable, or None if it isn't set. With
+    # as_bool, the value is read as a boolean.
+    def get_config(self, work_tree_dir, git_dir=None, name=None,
+            as_bool=False):
+        cmd = self.exe.config(name, get=True, bool=as_bool, _ok_codes=(0, 1),
+            **self._repo_opts(work_tree_dir, git_dir))
+        cmd.check()
+        if cmd.returncode == 1:
+            return None
+        value = cmd.output.rstrip('\n')
+        return is_true_str(value) if as_bool else value
+
+    def rev_ids(self, work_tree_dir, git_dir=None, revs=()):
+        cmd = self.exe.rev_parse(revs, **self._repo_opts(work_tree_dir, git_dir))
+        return tuple(cmd.check().output.splitlines())
+
+    def count_commits(self, work_tree_dir, git_dir=None, revs=()):
+        cmd = self.exe.rev_list(revs, count=True,
+            **self._repo_opts(work_tree_dir, git_dir))
+        return int(cmd.check().output)
+
+    # fsmonitor only applies with git's built-in daemon, since older versions
+    # would take the value as the path of a hook. The other accelerations are
+    # ignored by versions that don't know them. None leaves the repo's own
+    # configuration in effect.
+    def status(self, work_tree_dir, git_dir=None, paths=(), ignored=True,
+            untracked=None, untracked_cache=None, fsmonitor=None,
+            preload_index=None, index_threads=None):
+        if fsmonitor and not self.has_feature('fsmonitor--daemon'):
+            fsmonitor = None
+        cmd = self.exe.status('-z', '--', paths, ignored=ignored,
+            untracked_files=untracked,
+            _config={'core.untrackedCache': untracked_cache,
+                'core.fsmonitor': fsmonitor, 'core.preloadIndex': preload_index,
+                'index.threads': index_threads},
             **self._repo_opts(work_tree_dir, git_dir))
         return _parse_status_output(cmd.check().output)
 
+    def tracked_files(self, work_tree_dir, git_dir=None, paths=()):
+        cmd = self.exe.ls_files('-z', '--', paths,
+            **self._repo_opts(work_tree_dir, git_dir))
+        return cmd.check().output.split('\0')[:-1]
+
     def diff_summary(self, work_tree_dir, git_dir=None, revs=(), paths=(), 
             staged=False, renames=False):
         cmd = self.exe.diff('-z', '--numstat', revs, '--', paths,
@@ -405,15 +559,28 @@ class Git(object):
             **self._repo_opts(work_tree_dir, git_dir))
         return _parse_diff_summary(cmd.check().output)
 
+    # Paths are streamed to git over stdin, so that staging a large selection
+    # takes a single process and doesn't run into command line limits. That
+    # needs git 2.25, and older versions get them on the command line.
+    def _run_with_pathspecs(self, command, args, paths, work_tree_dir,
+            git_dir):
+        pathspecs = _pathspecs(paths)
+        repo_opts = self._repo_opts(work_tree_dir, git_dir)
+        version = self.build_options()[0]
+        if not version or version < (2, 25):
+            return command(args, '--', pathspecs, **repo_opts).check().output
+        cmd = command(args, pathspec_from_file='-', pathspec_file_nul=True,
+            **repo_opts)
+        return cmd.check(input=''.join(pathspec + '\0'
+            for pathspec in pathspecs)).output
+
     def stage(self, work_tree_dir, git_dir=None, paths=None):
-        cmd = self.exe.add('--all', '--', paths or '.',
-            **self._repo_opts(work_tree_dir, git_dir))
-        return cmd.check().output
+        return self._run_with_pathspecs(self.exe.add, '--all', paths,
+            work_tree_dir, git_dir)
 
     def unstage(self, work_tree_dir, git_dir=None, paths=None):
-        cmd = self.exe.reset('-q', '--', paths or '.',
-            **self._repo_opts(work_tree_dir, git_dir))
-        return cmd.check().output
+        return self._run_with_pathspecs(self.exe.reset, '-q', paths,
+            work_tree_dir, git_dir)
 
     def commit(self, work_tree_dir, message, git_dir=None, paths=(),
             amend=False):
@@ -424,10 +591,62 @@ class Git(object):
         cmd.stdin.close()
         return cmd.check().output
 
+    # grep, author and committer are regular expressions, ignore_case applies
+    # to them. pickaxe and pickaxe_regex look for commits that change the
+    # number of occurrences of a string (-S) or the lines matching a regular
+    # expression (-G).
     def log(self, work_tree_dir, git_dir=None, revs=None, paths=(),
-            all=False, max_commits=None, skip_commits=None):
-        cmd = self.exe.log(revs or (), '--', paths, all=all, format=LOG_FMT, 
-            decorate='full', max_count=max_commits, skip=skip_commits, parents=True,
+            all=False, max_commits=None, skip_commits=None, grep=None,
+            author=None, committer=None, pickaxe=None, pickaxe_regex=None,
+            since=None, until=None, ignore_case=False, no_walk=False,
+            subject_only=False):
+        cmd = self.exe.log(revs or (), '--', paths, all=all,
+            format=LOG_SUBJECT_FMT if subject_only else LOG_FMT,
+            max_count=max_commits, skip=skip_commits, parents=True,
+            no_decorate=True,
+            grep=grep, author=author, committer=committer, S=pickaxe,
+            G=pickaxe_regex, since=since, until=until,
+            regexp_ignore_case=ignore_case, no_walk=no_walk,
             **self._repo_opts(work_tree_dir, git_dir))
         return _parse_log_file(cmd.stdout)
 
+    # The commits given, in that order, without walking their history
+    def log_commits(self, work_tree_dir, git_dir=None, commit_ids=(),
+            subject_only=False):
+        cmd = self.exe.log(format=LOG_SUBJECT_FMT if subject_only else LOG_FMT,
+            parents=True, no_decorate=True, no_walk='unsorted', stdin=True,
+            **self._repo_opts(work_tree_dir, git_dir))
+        cmd.stdin.write(''.join(commit_id + '\n' for commit_id in commit_ids))
+        cmd.stdin.close()
+        return _parse_log_file(cmd.stdout)
+
+    # Writes the commit-graph for every commit reachable from refs, with the
+    # changed-path Bloom filters that let path-limited logs skip the commits
+    # that can't have touched a path. --split adds a layer for the commits
+    # that are new since the last write, instead of rewriting the whole file.
+    # Needs git 2.27, and returns whether it could be written.
+    def write_commit_graph(self, work_tree_dir, git_dir=None):
+        version = self.build_options()[0]
+        if not version or version < (2, 27):
+            return False
+        cmd = self.exe.commit_graph('write', '--reachable', '--changed-paths',
+            '--split', **self._repo_opts(work_tree_dir, git_dir))
+        cmd.check()
+        return True
+
+    def cat_file(self, work_tree_dir, git_dir=None):
+        return CatFile(self.exe.cat_file(batch=True,
+            **self._repo_opts(work_tree_dir, git_dir)))
+
+    # The (commit_id, parent_ids) of the commits git log would list, with
+    # parents rewritten the same way
+    def rev_list(self, work_tree_dir, git_dir=None, revs=None, paths=(),
+            all=False):
+        if not (revs or all): revs = ('HEAD',)
+        cmd = self.exe.rev_list(revs or (), '--', paths, all=all, parents=True,
+            _separate_stderr=True, **self._repo_opts(work_tree_dir, git_dir))
+        for line in cmd.stdout:
+            ids = line.split()
+            yield ids[0], tuple(ids[1:])
+        cmd.check(chomp=False)
+
@@ -0,0 +1,31 @@
+import os
+import os.path
+import subprocess
+
+
+def git(work_tree_dir, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME='A U Thor',
+        GIT_AUTHOR_EMAIL='author@example.com', GIT_COMMITTER_NAME='A U Thor',
+        GIT_COMMITTER_EMAIL='author@example.com')
+    subprocess.check_call(('git',) + args, cwd=work_tree_dir, env=env)
+
+
+def write_file(work_tree_dir, path, content):
+    with open(os.path.join(work_tree_dir, path), 'w') as f:
+        f.write(content)
+
+
+def create_history(work_tree_dir, commit_count):
+    # a linear history of commit_count commits, each with a body
+    subprocess.check_call(['git', 'init', '-q', work_tree_dir])
+    commands = []
+    for i in xrange(commit_count):
+        message = 'Commit %d\n\nThe body of commit %d.\n' % (i, i)
+        commands.append('commit refs/heads/master\n'
+            'committer A U Thor <author@example.com> %d +0000\n'
+            'data %d\n%s\n' % (1500000000 + i, len(message), message))
+    fast_import = subprocess.Popen(['git', 'fast-import', '--quiet'],
+        cwd=work_tree_dir, stdin=subprocess.PIPE)
+    fast_import.communicate(''.join(commands))
+    assert fast_import.returncode == 0
+    git(work_tree_dir, 'checkout', '-q', 'master')
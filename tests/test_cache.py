@@ -0,0 +1,51 @@
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'src'))
+
+from berk.cache import DiskCache
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.cache = DiskCache(self.base_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir)
+
+    def write_entry(self, data):
+        path = self.cache.entry_path('test', 'key')
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def test_store_and_load(self):
+        self.cache.store('test', 'key', ['value'], fingerprint=1)
+        self.assertEqual(self.cache.load('test', 'key', fingerprint=1),
+            ['value'])
+        self.assertIsNone(self.cache.load('test', 'key', fingerprint=2))
+
+    def test_garbage_entry(self):
+        self.write_entry('\x80\x02garbage that is no pickle at all')
+        self.assertIsNone(self.cache.load('test', 'key'))
+
+    def test_entry_of_another_shape(self):
+        self.write_entry('I42\n.')
+        self.assertIsNone(self.cache.load('test', 'key'))
+
+    def test_entry_naming_missing_class(self):
+        self.write_entry('cberk.cache\nNoSuchClass\n(tR.')
+        self.assertIsNone(self.cache.load('test', 'key'))
+        self.write_entry('cno_such_module\nNoSuchClass\n(tR.')
+        self.assertIsNone(self.cache.load('test', 'key'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'src'))
+
+import git_api
+from berk.model import Repo, Workspace
+from repos import create_history, git
+
+try:
+    from berk.gui.history.commit_store import CommitStore
+except ImportError:
+    # the berk.gui package needs PySide
+    CommitStore = None
+
+
+@unittest.skipIf(CommitStore is None, 'needs PySide')
+class CommitStoreTest(unittest.TestCase):
+    commit_count = 3
+
+    def setUp(self):
+        self.work_tree_dir = tempfile.mkdtemp()
+        create_history(self.work_tree_dir, self.commit_count)
+        self.workspace = Workspace(git_api.Git())
+        self.repo = Repo(work_tree_dir=self.work_tree_dir)
+        self.workspace.add_repo(self.repo)
+        self.store = CommitStore.acquire(self.repo)
+
+    def tearDown(self):
+        self.store.release()
+        shutil.rmtree(self.work_tree_dir)
+
+    def test_messages_of_subject_only_commits(self):
+        full = list(self.repo.log())
+        subjects = list(self.store.log(subject_only=True))
+        self.assertEqual([commit.message for commit in subjects],
+            [log_entry.message[:1] for log_entry in full])
+        commit_ids = [commit.commit_id for commit in subjects]
+        self.assertEqual(self.store.messages(commit_ids),
+            [log_entry.message for log_entry in full])
+        # reading them doesn't store them
+        self.assertFalse(any(self.store.commits.is_complete(commit.position)
+            for commit in subjects))
+
+
+    def commit_graph_written(self):
+        info_dir = os.path.join(self.repo.git_dir, 'objects', 'info')
+        return os.path.exists(os.path.join(info_dir, 'commit-graphs')) or \
+            os.path.exists(os.path.join(info_dir, 'commit-graph'))
+
+    def test_commit_graph_written(self):
+        version = self.repo.git.build_options()[0]
+        if not version or version < (2, 27):
+            self.skipTest('needs git 2.27')
+        self.store.update_commit_graph()
+        self.assertTrue(self.commit_graph_written())
+
+    def test_commit_graph_follows_core_commit_graph(self):
+        git(self.work_tree_dir, 'config', 'core.commitGraph', 'false')
+        self.store.update_commit_graph()
+        self.assertFalse(self.commit_graph_written())
+
+    def test_commit_graph_setting(self):
+        self.repo.commit_graph = False
+        self.store.update_commit_graph()
+        self.assertFalse(self.commit_graph_written())
+
+
+if __name__ == '__main__':
+    unittest.main()
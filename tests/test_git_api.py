@@ -0,0 +1,40 @@
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'src'))
+
+import git_api
+from repos import create_history
+
+
+class CatFileTest(unittest.TestCase):
+    def setUp(self):
+        self.work_tree_dir = tempfile.mkdtemp()
+        create_history(self.work_tree_dir, 3000)
+        self.git = git_api.Git()
+        self.cat_file = self.git.cat_file(self.work_tree_dir)
+
+    def tearDown(self):
+        self.cat_file.close()
+        shutil.rmtree(self.work_tree_dir)
+
+    def test_read_many_objects(self):
+        commit_ids = [commit_id for commit_id, parent_ids in
+            self.git.rev_list(self.work_tree_dir)]
+        missing_id = '0' * 40
+        objects = list(self.cat_file.read(commit_ids + [missing_id]))
+        self.assertEqual([object_id for object_id, object_type, data
+            in objects], commit_ids + [missing_id])
+        self.assertEqual(objects[0][1:], ('commit',
+            self.git.exe.cat_file('commit', commit_ids[0],
+                _cwd=self.work_tree_dir).check().output))
+        self.assertEqual(objects[-1], (missing_id, None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
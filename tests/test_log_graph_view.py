@@ -0,0 +1,93 @@
+import datetime
+import os.path
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'src'))
+
+import git_api
+
+try:
+    from PySide.QtCore import QAbstractTableModel, Qt
+    from PySide.QtGui import QApplication, QPixmap
+except ImportError:
+    QApplication = None
+
+
+# what the layout looks at, without reading refs from a repository
+class FakeRepo(object):
+    ref_map = None
+    head_ref = None
+
+
+def log_entry(commit_id, *parent_ids):
+    date = datetime.datetime(2020, 1, 1)
+    return git_api.LogEntry(commit_id, parent_ids, 'A U Thor',
+        'author@example.com', date, 'A U Thor', 'author@example.com', date,
+        ('Commit %s' % commit_id,))
+
+
+@unittest.skipIf(QApplication is None, 'needs PySide')
+class LogGraphViewTest(unittest.TestCase):
+    def setUp(self):
+        from berk.gui import FilterModel
+        from berk.gui.history import LogGraphDelegate, LogGraphLayout, \
+            LogGraphView
+
+        self.app = QApplication.instance() or QApplication([])
+        layout = LogGraphLayout(FakeRepo())
+        self.rows = layout.feed([log_entry('c', 'b'), log_entry('b', 'a'),
+            log_entry('a')])
+
+        class RowModel(QAbstractTableModel):
+            def __init__(self, rows):
+                super(RowModel, self).__init__()
+                self.rows = rows
+
+            def rowCount(self, parent):
+                return len(self.rows)
+
+            def columnCount(self, parent):
+                return 2
+
+            def data(self, index, role):
+                if role != Qt.DisplayRole: return None
+                row = self.rows[index.row()]
+                return row if index.column() == 0 else row.log_entry.message[0]
+
+            def model_item(self, index):
+                return self.rows[index.row()]
+
+        self.painted = painted = []
+
+        class RecordingDelegate(LogGraphDelegate):
+            def paint_graph(self, painter, rows, node_brush):
+                painted.append(list(rows))
+                super(RecordingDelegate, self).paint_graph(painter, rows,
+                    node_brush)
+
+        self.source_model = RowModel(self.rows)
+        self.filter_model = FilterModel()
+        self.filter_model.setSourceModel(self.source_model)
+        self.view = LogGraphView()
+        RecordingDelegate(uniform_row_height=True,
+            parent=self.view).install(self.view)
+        self.view.setModel(self.filter_model)
+        self.view.resize(400, 300)
+
+    def paint(self):
+        del self.painted[:]
+        QPixmap.grabWidget(self.view)
+        return self.painted
+
+    def test_paints_graph_through_filter_model(self):
+        self.assertEqual(self.paint(), [self.rows])
+
+    def test_paints_rows_left_by_filters(self):
+        self.filter_model.filters += lambda row: row is not self.rows[1]
+        self.assertEqual(self.paint(), [[self.rows[0], self.rows[2]]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'src'))
+
+import git_api
+from berk.model import Repo, Workspace
+from repos import git, write_file
+
+
+class RepoTestCase(unittest.TestCase):
+    def setUp(self):
+        self.work_tree_dir = tempfile.mkdtemp()
+        git(self.work_tree_dir, 'init', '-q')
+        write_file(self.work_tree_dir, 'file', 'one\n')
+        git(self.work_tree_dir, 'add', 'file')
+        git(self.work_tree_dir, 'commit', '-q', '-m', 'Add file')
+        self.workspace = Workspace(git_api.Git())
+        self.repo = Repo(work_tree_dir=self.work_tree_dir)
+        self.workspace.add_repo(self.repo)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_tree_dir)
+
+    def file_status(self):
+        item = self.repo.resolve('file')
+        return item.index_status, item.work_tree_status
+
+
+class RepoScanTest(RepoTestCase):
+    def test_scan_overtaken_by_stage_is_dropped(self):
+        write_file(self.work_tree_dir, 'file', 'two\n')
+        # started before the stage, so it sees the change unstaged
+        scan = self.repo.scan()
+        self.repo.stage(['file'])
+        staged = (git_api.MODIFIED, git_api.UNMODIFIED)
+        self.assertEqual(self.file_status(), staged)
+        self.assertFalse(self.repo.apply_scan(scan))
+        self.assertEqual(self.file_status(), staged)
+        self.assertTrue(self.repo.apply_scan(self.repo.scan()))
+        self.assertEqual(self.file_status(), staged)
+
+
+class StageTest(RepoTestCase):
+    def stage_and_unstage(self):
+        write_file(self.work_tree_dir, 'file', 'two\n')
+        self.repo.stage([self.repo.resolve('file')])
+        self.assertEqual(self.file_status(),
+            (git_api.MODIFIED, git_api.UNMODIFIED))
+        self.repo.unstage([self.repo.resolve('file')])
+        self.assertEqual(self.file_status(),
+            (git_api.UNMODIFIED, git_api.MODIFIED))
+
+    def test_stage_and_unstage(self):
+        self.stage_and_unstage()
+
+    def test_stage_and_unstage_with_git_before_2_25(self):
+        # without --pathspec-from-file
+        self.workspace.git._build_options = ((2, 24, 0), frozenset())
+        self.stage_and_unstage()
+
+    def test_status_limited_to_staged_paths(self):
+        status_paths = []
+        status = self.workspace.git.status
+        def recording_status(*args, **kwargs):
+            status_paths.append(kwargs['paths'])
+            return status(*args, **kwargs)
+        self.workspace.git.status = recording_status
+        self.repo.stage([self.repo.resolve('file')])
+        self.assertEqual(status_paths, [['file']])
+
+
+if __name__ == '__main__':
+    unittest.main()